@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from src.DataUpdateModule import DataUpdateModule
+from src.DayTrade import DayTrade
+from src.Strategy import Strategy
+from src.SyntheticData import SyntheticData
+
+class Benchmark:
+    """ Timing and memory benchmark of the backtest hot paths on synthetic data.
+
+    Every case writes `n_days` synthetic days (`SyntheticData`) to a temporary Parquet store and times,
+    per day, the stages of the notebook backtest loop:
+        read_data                `DataUpdateModule.read_data`
+        compute_tech_indicators  `Strategy.compute_tech_indicators`, with a cold indicator cache
+        entry_exit_signals       `Strategy.entry_exit_signals` for every model
+        signal_matrix            `Strategy.signal_matrix`, every model in one pass
+        trade                    `DayTrade(...).trade()` for every model
+        trade_all                `DayTrade.trade_all` for the whole grid
+    Timings are the best of `repeat` runs; peak memory is traced in a separate, untimed run.
+    Throughput is reported in model-days per second for the per-model loop (read_data +
+    compute_tech_indicators + trade) and for the batched one (read_data + compute_tech_indicators + trade_all).
+    """
+    STAGES = ["read_data", "compute_tech_indicators", "entry_exit_signals", "signal_matrix", "trade", "trade_all"]
+    # Values each grid param is drawn from; grids grow one param at a time in this order
+    PARAM_CHOICES = {
+        "fast": [20, 30, 5, 10],
+        "slow_mult": [3, 2],
+        "rsi_threshold": [70, 60],
+        "opt_leg1_dollar_from_atm": [2, 5, 0, 1],
+        "opt_leg2_dollar_from_leg1": [5, 10, 1, 2],
+        "stoploss_pct_of_maxprofit": [.1, .5, 1.],
+    }
+
+    def __init__(self, grid_sizes = [8, 64], n_days = [2], widths = [30], intervals = [5], seed = 0, repeat = 3, AUM = 6.5 * 1e6):
+        self.grid_sizes = grid_sizes
+        self.n_days = n_days
+        self.widths = widths
+        self.intervals = intervals
+        self.seed = seed
+        self.repeat = repeat
+        self.AUM = AUM
+
+    @classmethod
+    def params_grid(cls, n_models):
+        """ Deterministic params grid with at least `n_models` models (exactly, when reachable). """
+        counts = {x: 1 for x in cls.PARAM_CHOICES}
+        keys = list(cls.PARAM_CHOICES)
+        while np.prod(list(counts.values())) < n_models:
+            growable = [x for x in keys if counts[x] < len(cls.PARAM_CHOICES[x])]
+            if len(growable) == 0:
+                break
+            key = min(growable, key = lambda x: (counts[x], keys.index(x)))
+            counts[key] += 1
+        return {x: cls.PARAM_CHOICES[x][:counts[x]] for x in keys}
+
+    @staticmethod
+    def trade_dates(n_days):
+        return [x.to_pydatetime() for x in pd.date_range("2022-01-07", periods = n_days, freq = "W-FRI")]
+
+    def _run_stages(self, data_module, strategy, trade_dates, interval, timer):
+        n_models = len(strategy.get_models())
+        for trade_date in trade_dates:
+            with timer("read_data"):
+                df_stock, df_options = data_module.read_data(trade_date)
+            Strategy.indicator_cache.clear()
+            with timer("compute_tech_indicators"):
+                strategy.compute_tech_indicators(df_stock)
+            with timer("entry_exit_signals"):
+                for model_num in range(n_models):
+                    strategy.entry_exit_signals(model_num = model_num)
+            with timer("signal_matrix"):
+                strategy.signal_matrix(strategy.tech_indicators)
+            with timer("trade"):
+                for model_num in range(n_models):
+                    DayTrade(strategy, model_num = model_num, AUM = self.AUM, df_options = df_options, interval = interval).trade()
+            with timer("trade_all"):
+                DayTrade.trade_all(strategy, df_options, [self.AUM] * n_models, interval = interval)
+
+    def run_case(self, grid_size, n_days, width, interval):
+        """ Benchmark one point of the sweep.
+
+        Returns:
+            dict: Case parameters, per-stage seconds and peak MB, and model-days/sec throughput.
+        """
+        strategy = Strategy(params_grid = self.params_grid(grid_size))
+        n_models = len(strategy.get_models())
+        trade_dates = self.trade_dates(n_days)
+        with tempfile.TemporaryDirectory() as data_dir:
+            data_module = DataUpdateModule(options_interval_minutes = interval, data_dir = data_dir)
+            SyntheticData(seed = self.seed).write(data_module.store, trade_dates, interval = interval, width = width)
+
+            seconds = {x: np.inf for x in self.STAGES}
+            for _ in range(self.repeat):
+                run_seconds = {x: 0. for x in self.STAGES}
+                self._run_stages(data_module, strategy, trade_dates, interval, lambda stage: _Timer(run_seconds, stage))
+                seconds = {x: min(seconds[x], run_seconds[x]) for x in self.STAGES}
+
+            peak_mb = {x: 0. for x in self.STAGES}
+            tracemalloc.start()
+            try:
+                self._run_stages(data_module, strategy, trade_dates, interval, lambda stage: _MemoryTracer(peak_mb, stage))
+            finally:
+                tracemalloc.stop()
+            data_module.manifest.close()
+
+        model_days = n_models * n_days
+        load_seconds = seconds["read_data"] + seconds["compute_tech_indicators"]
+        return {
+            "grid_size": grid_size, "n_models": n_models, "n_days": n_days, "width": width, "interval": interval,
+            "stages": {x: {"seconds": seconds[x], "peak_mb": peak_mb[x]} for x in self.STAGES},
+            "model_days_per_sec": {
+                "trade": model_days / (load_seconds + seconds["trade"]),
+                "trade_all": model_days / (load_seconds + seconds["trade_all"]),
+            },
+        }
+
+    def run(self, verbose = True):
+        """ Run the sweep over grid_sizes x n_days x widths x intervals.
+
+        Returns:
+            dict: {"meta": environment and settings, "cases": list of `run_case` results}.
+        """
+        cases = list()
+        for grid_size, n_days, width, interval in product(self.grid_sizes, self.n_days, self.widths, self.intervals):
+            case = self.run_case(grid_size, n_days, width, interval)
+            cases.append(case)
+            if verbose:
+                print(f"models={case['n_models']} days={n_days} width={width} interval={interval}: "
+                    + ", ".join(f"{x}={case['stages'][x]['seconds']:.3f}s" for x in self.STAGES)
+                    + f" | model-days/sec trade={case['model_days_per_sec']['trade']:.1f} trade_all={case['model_days_per_sec']['trade_all']:.1f}")
+        meta = {
+            "created": datetime.now().isoformat(timespec = "seconds"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "numpy": np.__version__, "pandas": pd.__version__,
+            "seed": self.seed, "repeat": self.repeat,
+        }
+        return {"meta": meta, "cases": cases}
+
+    @staticmethod
+    def _case_key(case):
+        return (case["n_models"], case["n_days"], case["width"], case["interval"])
+
+    @classmethod
+    def compare(cls, results, baseline, tolerance = 0.25, min_seconds = 0.01):
+        """ Stage timings of `results` that regressed against `baseline`.
+
+        A stage regresses when it is slower than the baseline by more than `tolerance` (relative) and
+        by more than `min_seconds`, so sub-noise stages do not trip the gate. Cases and stages
+        missing from the baseline are ignored.
+
+        Returns:
+            list: Human-readable regression messages; empty if none.
+        """
+        baseline_cases = {cls._case_key(x): x for x in baseline["cases"]}
+        regressions = list()
+        for case in results["cases"]:
+            base = baseline_cases.get(cls._case_key(case))
+            if base is None:
+                continue
+            for stage in [x for x in cls.STAGES if x in base["stages"]]:
+                new, old = case["stages"][stage]["seconds"], base["stages"][stage]["seconds"]
+                if new > old * (1 + tolerance) and new - old > min_seconds:
+                    regressions.append(f"{stage} models={case['n_models']} days={case['n_days']} width={case['width']} interval={case['interval']}: {old:.3f}s -> {new:.3f}s ({new / old - 1:+.0%})")
+        return regressions
+
+    @staticmethod
+    def save(results, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent = 2)
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            return json.load(f)
+
+
+class _Timer:
+    def __init__(self, seconds, stage):
+        self.seconds = seconds
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.seconds[self.stage] += time.perf_counter() - self.start
+
+
+class _MemoryTracer:
+    def __init__(self, peak_mb, stage):
+        self.peak_mb = peak_mb
+        self.stage = stage
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.start = tracemalloc.get_traced_memory()[0]
+
+    def __exit__(self, *exc):
+        self.peak_mb[self.stage] = max(self.peak_mb[self.stage], (tracemalloc.get_traced_memory()[1] - self.start) / 2 ** 20)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the backtest hot paths on synthetic data.")
+    parser.add_argument("--grid-sizes", type = int, nargs = "+", default = [8, 64])
+    parser.add_argument("--days", type = int, nargs = "+", default = [2])
+    parser.add_argument("--widths", type = int, nargs = "+", default = [30])
+    parser.add_argument("--intervals", type = int, nargs = "+", default = [5])
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--out", default = "benchmark.json")
+    parser.add_argument("--baseline", help = "Compare against this results file and exit 1 on regressions")
+    parser.add_argument("--tolerance", type = float, default = 0.25)
+    parser.add_argument("--save-baseline", action = "store_true", help = "Also write the results to --baseline")
+    args = parser.parse_args()
+
+    results = Benchmark(args.grid_sizes, args.days, args.widths, args.intervals, seed = args.seed, repeat = args.repeat).run()
+    Benchmark.save(results, args.out)
+    print(f"Results written to {args.out}")
+    if args.baseline is not None:
+        if args.save_baseline:
+            Benchmark.save(results, args.baseline)
+            print(f"Baseline written to {args.baseline}")
+        elif os.path.exists(args.baseline):
+            regressions = Benchmark.compare(results, Benchmark.load(args.baseline), tolerance = args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            if len(regressions) > 0:
+                sys.exit(1)
+            print(f"No regressions against {args.baseline}")
+        else:
+            print(f"Baseline {args.baseline} not found; run with --save-baseline to create it")
@@ -0,0 +1,75 @@
+import numpy as np
+from scipy.special import ndtr
+
+class BlackScholes:
+    """ Vectorised Black-Scholes prices, greeks and implied volatility of European options.
+
+    Every argument broadcasts as numpy arrays do, so a whole chain (or minutes x strikes grid) is priced
+    in one call. `years` is time to expiry in years and `iv` the annualised volatility, as in the
+    `callMidIv`/`putMidIv` columns of the options data.
+    """
+
+    @staticmethod
+    def d1_d2(spot, strike, years, iv, rate = 0.):
+        spot, strike, years, iv = (np.asarray(x, dtype = float) for x in (spot, strike, years, iv))
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            d1 = (np.log(spot / strike) + (rate + 0.5 * iv ** 2) * years) / (iv * np.sqrt(years))
+        return d1, d1 - iv * np.sqrt(years)
+
+    @classmethod
+    def prices(cls, spot, strike, years, iv, rate = 0.):
+        """ (call, put) prices; the put follows from put-call parity. """
+        d1, d2 = cls.d1_d2(spot, strike, years, iv, rate)
+        discounted_strike = strike * np.exp(-rate * np.asarray(years, dtype = float))
+        call = spot * ndtr(d1) - discounted_strike * ndtr(d2)
+        return call, call - spot + discounted_strike
+
+    @classmethod
+    def greeks(cls, spot, strike, years, iv, rate = 0.):
+        """ Delta, gamma, vega (per 1.00 of volatility) and theta (per year) of calls and puts.
+
+        Returns:
+            dict: "call_delta", "put_delta", "gamma", "vega", "call_theta", "put_theta".
+        """
+        spot, strike, years, iv = (np.asarray(x, dtype = float) for x in (spot, strike, years, iv))
+        d1, d2 = cls.d1_d2(spot, strike, years, iv, rate)
+        density = np.exp(-0.5 * d1 ** 2) / np.sqrt(2 * np.pi)
+        discounted_strike = strike * np.exp(-rate * years)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            gamma = density / (spot * iv * np.sqrt(years))
+            decay = -spot * density * iv / (2 * np.sqrt(years))
+        return {
+            "call_delta": ndtr(d1),
+            "put_delta": ndtr(d1) - 1,
+            "gamma": gamma,
+            "vega": spot * density * np.sqrt(years),
+            "call_theta": decay - rate * discounted_strike * ndtr(d2),
+            "put_theta": decay + rate * discounted_strike * ndtr(-d2),
+        }
+
+    @classmethod
+    def implied_volatility(cls, price, spot, strike, years, is_call, rate = 0., low = 1e-4, high = 5., iterations = 60):
+        """ Volatility reproducing `price`, by bisection on every element at once.
+
+        Prices outside the range spanned by [low, high] volatility give NaN. Prices that do not depend on
+        volatility to float precision (vega ~ 0, e.g. deep in the money near expiry) give an arbitrary value in range.
+
+        Args:
+            is_call (bool or np.ndarray): True for calls, False for puts.
+        """
+        price, spot, strike, years, is_call = np.broadcast_arrays(*(np.asarray(x) for x in (price, spot, strike, years, is_call)))
+        price = price.astype(float)
+
+        def model(iv):
+            call, put = cls.prices(spot, strike, years, iv, rate)
+            return np.where(is_call, call, put)
+
+        lower = np.full(price.shape, low)
+        upper = np.full(price.shape, high)
+        solvable = (model(lower) <= price) & (price <= model(upper))
+        for _ in range(iterations):
+            middle = 0.5 * (lower + upper)
+            above = model(middle) > price
+            upper = np.where(above, middle, upper)
+            lower = np.where(above, lower, middle)
+        return np.where(solvable, 0.5 * (lower + upper), np.nan)
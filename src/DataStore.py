@@ -0,0 +1,191 @@
+import os
+import re
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+class DataStore:
+    """ Date-partitioned Parquet store for the stock bars and options chains of each trading day.
+
+    Layout (hive-style, one directory per trading day):
+        {root}/stock/date=YYYYMMDD/*.parquet
+        {root}/options/date=YYYYMMDD/*.parquet
+
+    Options are written with compact dtypes: int64 epoch-nanosecond time, dictionary-encoded strikes,
+    float32 quotes and greeks, int32 sizes/volumes/open interest. Quotes are quoted in cents, so
+    `read_options` rounds them back to cents and returns the same float64 values as the CSV files.
+    """
+    TIMEZONE = "America/New_York"
+    QUOTE_COLUMNS = ['callBidPrice', 'callAskPrice', 'putBidPrice', 'putAskPrice']
+    OPTIONS_SCHEMA = pa.schema([
+        ("time", pa.int64()),
+        ("strike", pa.dictionary(pa.int16(), pa.float64())),
+        ("stockPrice", pa.float64()),
+        ("callDelta", pa.float32()), ("putDelta", pa.float32()),
+        ("callMidIv", pa.float32()), ("putMidIv", pa.float32()),
+        ("callOpenInterest", pa.int32()), ("callVolume", pa.int32()), ("callBidSize", pa.int32()), ("callAskSize", pa.int32()),
+        ("callBidPrice", pa.float32()), ("callAskPrice", pa.float32()),
+        ("putOpenInterest", pa.int32()), ("putVolume", pa.int32()), ("putBidSize", pa.int32()), ("putAskSize", pa.int32()),
+        ("putBidPrice", pa.float32()), ("putAskPrice", pa.float32()),
+    ])
+    STOCK_SCHEMA = pa.schema([
+        ("datetime", pa.int64()),
+        ("open", pa.float64()), ("high", pa.float64()), ("low", pa.float64()), ("close", pa.float64()),
+        ("volume", pa.int64()),
+    ])
+
+    def __init__(self, root = "data/store"):
+        self.root = root
+
+    def _partition(self, kind, trade_date):
+        return os.path.join(self.root, kind, f"date={trade_date.strftime('%Y%m%d')}")
+
+    def has_day(self, trade_date):
+        return all(os.path.isdir(self._partition(kind, trade_date)) for kind in ["stock", "options"])
+
+    def available_days(self):
+        """ Trading days with both stock and options partitions. """
+        days = None
+        for kind in ["stock", "options"]:
+            path = os.path.join(self.root, kind)
+            found = {x[5:] for x in os.listdir(path) if x.startswith("date=")} if os.path.isdir(path) else set()
+            days = found if days is None else days & found
+        return sorted(datetime.strptime(x, "%Y%m%d") for x in days)
+
+    # Writing
+    @staticmethod
+    def _epoch_ns(values):
+        """ int64 epoch nanoseconds (UTC) of tz-aware datetimes, whatever their resolution. """
+        return pd.DatetimeIndex(values).tz_convert("UTC").as_unit("ns").asi8
+
+    def write_stock(self, trade_date, df_stock, part = "part-0"):
+        df = df_stock.reset_index()
+        table = pa.table({
+            "datetime": self._epoch_ns(df.loc[:, "datetime"]),
+            **{x: pa.array(df.loc[:, x].to_numpy(), from_pandas = True) for x in ["open", "high", "low", "close", "volume"]},
+        }).cast(self.STOCK_SCHEMA)
+        self._write(table, self._partition("stock", trade_date), part)
+
+    def write_options(self, trade_date, df_options, part = "part-0"):
+        df = df_options.sort_values(["time", "strike"], kind = "stable")
+        table = pa.table({
+            "time": self._epoch_ns(df.loc[:, "time"]),
+            **{x: pa.array(df.loc[:, x].to_numpy(), from_pandas = True) for x in self.OPTIONS_SCHEMA.names if x != "time"},
+        })
+        table = table.set_column(table.schema.get_field_index("strike"), "strike", table.column("strike").dictionary_encode())
+        self._write(table.cast(self.OPTIONS_SCHEMA), self._partition("options", trade_date), part)
+
+    def compact_options(self, trade_date):
+        """ Merge the part files of a day (e.g. one per fetched snapshot) into a single time-sorted file. """
+        directory = self._partition("options", trade_date)
+        parts = [x for x in os.listdir(directory) if x.endswith(".parquet")]
+        if parts == ["part-0.parquet"]:
+            return
+        table = pq.read_table(directory)
+        time = table.column("time").to_numpy()
+        strike = table.column("strike").cast(pa.float64()).to_numpy()
+        keep = np.flatnonzero(~pd.DataFrame({"time": time, "strike": strike}).duplicated().to_numpy()) # parts rewritten after an interrupted run
+        keep = keep[np.lexsort([strike[keep], time[keep]])]
+        table = table.take(keep)
+        table = table.set_column(table.schema.get_field_index("strike"), "strike", pa.array(strike[keep]).dictionary_encode())
+        self._write(table.cast(self.OPTIONS_SCHEMA), directory, "part-0")
+        for part in parts:
+            if part != "part-0.parquet":
+                os.remove(os.path.join(directory, part))
+
+    @staticmethod
+    def _write(table, directory, part):
+        os.makedirs(directory, exist_ok = True)
+        path = os.path.join(directory, f"{part}.parquet")
+        temp_path = os.path.join(directory, f".{part}.parquet.tmp") # dot-prefixed files are skipped by readers
+        pq.write_table(table, temp_path, compression = "zstd")
+        os.replace(temp_path, path)
+
+    # Reading
+    def read_stock(self, trade_date, columns = None):
+        """ Stock bars of a day, indexed by tz-aware datetime as in `DataUpdateModule.read_data`. """
+        if columns is not None:
+            columns = ["datetime"] + [x for x in columns if x != "datetime"]
+        table = pq.read_table(self._partition("stock", trade_date), columns = columns)
+        df = table.to_pandas()
+        df["datetime"] = pd.to_datetime(df.loc[:, "datetime"], utc = True).dt.tz_convert(self.TIMEZONE)
+        return df.sort_values("datetime").set_index("datetime")
+
+    def read_options(self, trade_date, columns = None, filters = None):
+        """ Options chains of a day with projection and predicate pushdown.
+
+        Args:
+            trade_date (datetime): Trading day.
+            columns (list): Columns to load; `time` is always included. Defaults to all columns.
+            filters (list): pyarrow DNF filters, e.g. `[("strike", ">=", 450), ("strike", "<=", 480)]`.
+                `time` is stored as int64 epoch nanoseconds (UTC); Timestamps are converted.
+
+        Returns:
+            pd.DataFrame: Same layout as the CSV path of `DataUpdateModule.read_data`, with identical quotes,
+                strikes and stockPrice; greeks/IVs carry float32 precision and counts are int32.
+        """
+        if columns is not None:
+            columns = ["time"] + [x for x in columns if x != "time"]
+        table = pq.read_table(self._partition("options", trade_date), columns = columns, filters = self._normalise_filters(filters))
+        return self._options_frame(table)
+
+    def _options_frame(self, table):
+        """ DataFrame of a table read from the options partitions, converted as `read_options` returns it. """
+        df = table.to_pandas()
+        if "strike" in df.columns:
+            df["strike"] = df.loc[:, "strike"].astype(float)
+        for column in df.columns:
+            if df.loc[:, column].dtype == np.float32:
+                values = df.loc[:, column].to_numpy(dtype = float)
+                df[column] = np.round(values, 2) if column in self.QUOTE_COLUMNS else values
+        df["time"] = pd.to_datetime(df.loc[:, "time"], utc = True).dt.tz_convert(self.TIMEZONE)
+        return df.loc[:, [x for x in df.columns if x != "time"] + ["time"]].reset_index(drop = True)
+
+    def _normalise_filters(self, filters):
+        if filters is None:
+            return None
+        def normalise(condition):
+            column, op, value = condition
+            if column == "time":
+                value = [self._epoch_ns([x])[0] for x in value] if op in ("in", "not in") else self._epoch_ns([value])[0]
+            return (column, op, value)
+        if isinstance(filters[0], list):
+            return [[normalise(x) for x in conjunction] for conjunction in filters]
+        return [normalise(x) for x in filters]
+
+    # Migration
+    def migrate_csv(self, csv_dir = "data", overwrite = False):
+        """ One-shot conversion of a `stock_data_YYYYMMDD.csv` / `options_data_YYYYMMDD.csv` tree.
+
+        Returns:
+            list: Trading days written to the store.
+        """
+        migrated = list()
+        for file_name in sorted(os.listdir(csv_dir)):
+            match = re.fullmatch(r"(stock|options)_data_(\d{8})\.csv", file_name)
+            if match is None:
+                continue
+            kind, trade_date = match.group(1), datetime.strptime(match.group(2), "%Y%m%d")
+            if os.path.isdir(self._partition(kind, trade_date)) and not overwrite:
+                continue
+            path = os.path.join(csv_dir, file_name)
+            if kind == "stock":
+                self.write_stock(trade_date, pd.read_csv(path, parse_dates = ['datetime'], index_col = 'datetime'))
+            else:
+                self.write_options(trade_date, pd.read_csv(path, parse_dates = ['time']).drop(columns = ['Unnamed: 0']))
+            migrated.append(trade_date)
+        return sorted(set(migrated))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Migrate the per-day CSV files to the Parquet data store.")
+    parser.add_argument("--csv-dir", default = "data")
+    parser.add_argument("--store", default = "data/store")
+    parser.add_argument("--overwrite", action = "store_true")
+    args = parser.parse_args()
+    days = DataStore(args.store).migrate_csv(args.csv_dir, overwrite = args.overwrite)
+    print(f"Migrated {len(days)} trading days to {args.store}")
@@ -1,29 +1,60 @@
 import os
+import re
+import shutil
 from dotenv import load_dotenv
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
 from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import io
-import requests
+import numpy as np
 import pandas as pd
 from eodhd import APIClient
 
+from src.DataStore import DataStore
+from src.Instrumentation import instrumentation
+from src.Manifest import Manifest
+from src.OptionsDataset import OptionsDataset
+from src.OratsFetcher import OratsFetcher
+
 class DataUpdateModule:
     
-    def __init__(self, options_interval_minutes = 5):
+    def __init__(self, options_interval_minutes = 5, storage = "parquet", data_dir = "data", max_workers = 1, requests_per_minute = 1000, orats_url = OratsFetcher.URL):
         # Get tokens
         load_dotenv()
         self.TOKEN_EODHD = os.getenv('TOKEN_EODHD')
         self.TOKEN_ORATS = os.getenv('TOKEN_ORATS')
-        self.EODHD_api = self._connect_to_eodhd()
+        self._EODHD_api = None # connected on first use, so stored data can be read offline
 
         # params
         self.options_interval_minutes = options_interval_minutes
 
+        # storage: "parquet" uses the partitioned DataStore under {data_dir}/store, "csv" the per-day CSV files
+        if storage not in ("parquet", "csv"):
+            raise ValueError(f"Unknown storage: {storage}")
+        self.storage = storage
+        self.data_dir = data_dir
+        self.store = DataStore(os.path.join(data_dir, "store"))
+        # Index of fetched snapshots and stock ranges, kept beside the data it describes
+        manifest_dir = self.store.root if storage == "parquet" else data_dir
+        os.makedirs(manifest_dir, exist_ok = True)
+        self.manifest = Manifest(os.path.join(manifest_dir, "manifest.sqlite"))
+        self._reconciled = False # data on disk indexed, see `reconcile`
+
+        # ORATS client: pooled session, token-bucket rate limit and retries; max_workers > 1 fetches snapshots concurrently
+        self.max_workers = max_workers
+        self.orats = OratsFetcher(self.TOKEN_ORATS, url = orats_url, max_workers = max_workers, requests_per_minute = requests_per_minute)
+
     def _connect_to_eodhd(self):
         api = APIClient(self.TOKEN_EODHD)
         return api
+
+    @property
+    def EODHD_api(self):
+        if self._EODHD_api is None:
+            self._EODHD_api = self._connect_to_eodhd()
+        return self._EODHD_api
     
     def _get_stock_data(self, from_est, to_est):
         """ Get intraday historical data for SPY between from_est and to_est (both datetime objects in EST timezone).
@@ -37,35 +68,26 @@ class DataUpdateModule:
         """
         # from_utc = (from_est + relativedelta(hours = 5)).replace(tzinfo = pytz.utc)
         # to_utc = (to_est + relativedelta(hours = 5)).replace(tzinfo = pytz.utc)
-        df = self.EODHD_api.get_intraday_historical_data(
-            symbol = "SPY.US", 
-            interval = "1m", 
-            from_unix_time = from_est.replace(tzinfo=ZoneInfo("America/New_York")).astimezone(ZoneInfo('UTC')).timestamp(), #from_utc.timestamp(),
-            to_unix_time = to_est.replace(tzinfo=ZoneInfo("America/New_York")).astimezone(ZoneInfo('UTC')).timestamp()#to_utc.timestamp()
-        )
+        with instrumentation.timer("eodhd.request"):
+            df = self.EODHD_api.get_intraday_historical_data(
+                symbol = "SPY.US", 
+                interval = "1m", 
+                from_unix_time = from_est.replace(tzinfo=ZoneInfo("America/New_York")).astimezone(ZoneInfo('UTC')).timestamp(), #from_utc.timestamp(),
+                to_unix_time = to_est.replace(tzinfo=ZoneInfo("America/New_York")).astimezone(ZoneInfo('UTC')).timestamp()#to_utc.timestamp()
+            )
+        instrumentation.count("eodhd.rows", len(df))
         df = pd.DataFrame(df)
         df.loc[:, "datetime"] = pd.to_datetime(df.loc[:, "timestamp"], unit='s').dt.tz_localize('UTC').dt.tz_convert('America/New_York') #df.loc[:, "datetime"]) - pd.Timedelta(hours = 5)
         df = df.loc[:, ["datetime", "open", "high", "low", "close", "volume"]].set_index('datetime')
         return df
     
-    def _get_options_data(self, trade_minute_est):
-        """ Get options data for SPY at the given trade minute in EST timezone.
-        
-        Args:
-            trade_minute_est (datetime): Trade minute in EST timezone (seconds must be zero).
-        
-        Returns:
-            pd.DataFrame: DataFrame containing filtered options data.
-        """
-        assert trade_minute_est.second == 0, "Seconds must be zero"
-        trade_date_str = trade_minute_est.strftime("%Y%m%d%H%M")
-        url = "https://api.orats.io/datav2/historical/one-minute/strikes/chain"
-
-        querystring = {"token" : self.TOKEN_ORATS, "ticker" : "SPY", "tradeDate" : trade_date_str}
-        response = requests.request("GET", url, params=querystring)
-        df = pd.read_csv(io.StringIO(response.content.decode('utf-8')))
-        if response.status_code == 404:
+    @staticmethod
+    def _parse_options_data(content, trade_minute_est):
+        """ Keep the dte == 1 chain of a raw ORATS response and tag it with its trade minute. """
+        if content is None:
             return None
+        with instrumentation.timer("options.parse_csv"):
+            df = pd.read_csv(io.StringIO(content.decode('utf-8')))
         df_out = df[
                 (df.loc[:, "dte"] == 1) #&
                 # ((df.loc[:, "delta"] > 0.05) | ((df.loc[:, "delta"] - 1).abs() < 0.95)) &
@@ -76,41 +98,283 @@ class DataUpdateModule:
                 'callOpenInterest', 'callVolume', 'callBidSize', 'callAskSize', 'callBidPrice', 'callAskPrice',
                 'putOpenInterest', 'putVolume', 'putBidSize', 'putAskSize', 'putBidPrice', 'putAskPrice'
             ]].assign(time = trade_minute_est.replace(tzinfo=ZoneInfo("America/New_York")))
+        instrumentation.count("options.rows_fetched", len(df))
+        instrumentation.count("options.rows_kept", len(df_out)) # dte == 1
         return df_out
     
-    def update_data(self, trade_date, update_stock = True, update_options = True):
+    def _options_trade_minutes(self, trade_date):
+        """ Trade minutes (EST) of the options snapshots of a day, every options_interval_minutes from 0930 to 1500H. """
+        start = trade_date.replace(hour = 9, minute = 30, second = 0)
+        end = trade_date.replace(hour = 15, minute = 1, second = 0)
+        delta = relativedelta(minutes = self.options_interval_minutes)
+        trade_minutes = list()
+        while start <= end:
+            trade_minutes.append(start)
+            start += delta
+        return trade_minutes
+
+    def _fetch_stock_data(self, trade_date):
+        from_est, to_est = self._stock_range(trade_date)
+        return self._get_stock_data(from_est = from_est, to_est = to_est)
+
+    def _stock_range(self, trade_date):
+        return trade_date.replace(hour = 6, minute = 30, second = 0), trade_date.replace(hour = 15, minute = 0, second = 0)
+
+    def _csv_path(self, kind, trade_date):
+        return os.path.join(self.data_dir, f"{kind}_data_{trade_date.strftime('%Y%m%d')}.csv")
+
+    def _save_stock_data(self, trade_date, df_stock):
+        if self.storage == "parquet":
+            self.store.write_stock(trade_date, df_stock)
+        else:
+            df_stock.to_csv(self._csv_path("stock", trade_date))
+
+    def _append_options_data(self, trade_date, trade_minute, df_options):
+        """ Persist one snapshot straight away so an interrupted day keeps what it has fetched. """
+        with instrumentation.timer("options.save_snapshot"):
+            if self.storage == "parquet":
+                self.store.write_options(trade_date, df_options, part = f"snapshot-{trade_minute.strftime('%H%M')}")
+            else:
+                path = self._csv_path("options", trade_date)
+                df_options.to_csv(path, mode = "a", header = not os.path.exists(path))
+
+    def _finish_options_data(self, trade_date):
+        """ Leave a completed day's options, saved in fetch completion order, sorted by snapshot and strike. """
+        if self.storage == "parquet":
+            if os.path.isdir(self.store._partition("options", trade_date)):
+                self.store.compact_options(trade_date)
+        elif os.path.exists(self._csv_path("options", trade_date)):
+            self._sort_options_csv(self._csv_path("options", trade_date))
+
+    @staticmethod
+    def _sort_options_csv(path):
+        """ Rewrite an options CSV sorted by time and strike, without the rows of snapshots saved twice. """
+        df = pd.read_csv(path, index_col = 0)
+        keys = df.loc[:, ["time", "strike"]]
+        if pd.MultiIndex.from_frame(keys).is_monotonic_increasing and not keys.duplicated().any():
+            return
+        temp_path = f"{path}.tmp"
+        df[~keys.duplicated()].sort_values(["time", "strike"], kind = "stable").to_csv(temp_path)
+        os.replace(temp_path, path)
+
+    def _remove_day(self, trade_date, update_stock, update_options):
+        kinds = [x for x, update in [("stock", update_stock), ("options", update_options)] if update]
+        for kind in kinds:
+            if self.storage == "parquet":
+                shutil.rmtree(self.store._partition(kind, trade_date), ignore_errors = True)
+            elif os.path.exists(self._csv_path(kind, trade_date)):
+                os.remove(self._csv_path(kind, trade_date))
+        self.manifest.forget_day(trade_date)
+
+    def update_data(self, trade_date, update_stock = True, update_options = True, refresh = False):
+        """ Fetch whatever is missing for a trading day and return its data.
+
+        Snapshots already recorded in the manifest are not fetched again, so rerunning after an
+        interruption resumes where it stopped. `refresh = True` discards the day and refetches it.
+
+        Returns:
+            tuple: (df_stock, df_options), None for the parts not updated.
+        """
+        if refresh:
+            self._remove_day(trade_date, update_stock, update_options)
+        self.backfill([trade_date], update_stock = update_stock, update_options = update_options)
+
         df_stock = None
         df_options = None
-        
         if update_stock:
-            # Update stock data
-            df_stock = self._get_stock_data(
-                from_est = trade_date.replace(hour = 6, minute = 30, second = 0),
-                to_est = trade_date.replace(hour = 15, minute = 0, second = 0)
-            )
+            df_stock = self.store.read_stock(trade_date) if self.storage == "parquet" else \
+                pd.read_csv(self._csv_path("stock", trade_date), parse_dates=['datetime'], index_col='datetime')
             print(f"Stock data: {len(df_stock)} rows")
-            # Save data
-            df_stock.to_csv(f"data/stock_data_{trade_date.strftime('%Y%m%d')}.csv")
-
         if update_options:
-            # Update options data
-            start = trade_date.replace(hour = 9, minute = 30, second = 0)
-            end = trade_date.replace(hour = 15, minute = 1, second = 0)
-            delta = relativedelta(minutes = self.options_interval_minutes)
-            dfs = list()
-            while start <= end:
-                df = self._get_options_data(trade_minute_est = start)
+            df_options = self.read_data(trade_date)[1]
+            print(f"Options data: {len(df_options)} rows")
+        return df_stock, df_options
+
+    def backfill(self, trade_dates, update_stock = True, update_options = True):
+        """ Fetch and save the missing data of many trading days concurrently.
+
+        Only snapshots and stock ranges absent from the manifest are fetched, after data already on disk
+        for these days has been indexed with `reconcile`. Snapshots of all days share
+        one pool of `max_workers` threads and the ORATS rate limit; each snapshot is saved and recorded as
+        soon as it arrives, and a day's snapshots are compacted once the last one is in.
+
+        Args:
+            trade_dates (list): Trading days (datetime) to fetch.
+
+        Returns:
+            list: Trading days that are complete in the manifest afterwards.
+        """
+        self.reconcile(trade_dates)
+        pending = dict()
+        executor = ThreadPoolExecutor(max_workers = max(1, self.max_workers))
+        try:
+            futures = dict()
+            for trade_date in trade_dates:
+                if update_stock and not self.manifest.has_stock_range(trade_date):
+                    futures[executor.submit(self._fetch_stock_data, trade_date)] = (trade_date, None)
+                if update_options:
+                    trade_minutes = self._options_trade_minutes(trade_date)
+                    self.manifest.expect_day(trade_date, trade_minutes)
+                    missing = self.manifest.missing_snapshots(trade_minutes)
+                    pending[trade_date] = len(missing)
+                    for trade_minute in missing:
+                        futures[executor.submit(self.orats.fetch, trade_minute)] = (trade_date, trade_minute)
+                    if len(missing) == 0:
+                        self._finish_options_data(trade_date)
+
+            for future in as_completed(futures):
+                trade_date, trade_minute = futures[future]
+                if trade_minute is None:
+                    df_stock = future.result()
+                    self._save_stock_data(trade_date, df_stock)
+                    self.manifest.record_stock_range(trade_date, *self._stock_range(trade_date), rows = len(df_stock))
+                    print(f"{trade_date.strftime('%Y-%m-%d')} stock data: {len(df_stock)} rows")
+                    continue
+                df_options = self._parse_options_data(future.result(), trade_minute)
+                if df_options is not None:
+                    self._append_options_data(trade_date, trade_minute, df_options)
+                self.manifest.record_snapshot(trade_minute, None if df_options is None else len(df_options))
                 print("*", end="", flush=True)
-                dfs.append(df)
-                start += delta
-            df_options = pd.concat(dfs, axis=0)
-            print(f"\nOptions data: {len(df_options)} rows")
-            # Save data
-            df_options.to_csv(f"data/options_data_{trade_date.strftime('%Y%m%d')}.csv")
+                pending[trade_date] -= 1
+                if pending[trade_date] == 0:
+                    self._finish_options_data(trade_date)
+                    print(f"\n{trade_date.strftime('%Y-%m-%d')} options data complete")
+        finally:
+            # on errors or interrupts, drop queued requests; everything recorded so far is kept
+            executor.shutdown(wait = True, cancel_futures = True)
+        return [x for x in trade_dates if self.manifest.is_complete(x)]
+
+    def available_days(self, start = None, end = None):
+        """ Complete trading days (stock bars and every options snapshot fetched), from the manifest.
+
+        The first call of an instance indexes the data on disk that the manifest has no record of (see
+        `reconcile`); later calls only query the manifest.
+        """
+        if not self._reconciled:
+            self.reconcile()
+        return self.manifest.available_days(start = start, end = end)
+
+    def _days_on_disk(self, kind):
+        """ Days with a stock or options ("kind") file or partition in the configured storage. """
+        if self.storage == "parquet":
+            path = os.path.join(self.store.root, kind)
+            names = [x[5:] for x in os.listdir(path) if x.startswith("date=")] if os.path.isdir(path) else list()
+        else:
+            files = [re.fullmatch(rf"{kind}_data_(\d{{8}})\.csv", x) for x in os.listdir(self.data_dir)] if os.path.isdir(self.data_dir) else list()
+            names = [x.group(1) for x in files if x is not None]
+        return {datetime.strptime(x, "%Y%m%d") for x in names}
+
+    def reconcile(self, trade_dates = None):
+        """ Index the stock and options data on disk that the manifest has no record of.
+
+        Such data, e.g. CSV days fetched before the manifest existed or days migrated into the Parquet
+        store, would otherwise be missing from `available_days` and fetched again by `backfill`.
+
+        Args:
+            trade_dates (list): Days to check; defaults to every day on disk.
+
+        Returns:
+            list: Trading days indexed.
+        """
+        stock_days, options_days = self._days_on_disk("stock"), self._days_on_disk("options")
+        if trade_dates is not None:
+            stock_days, options_days = stock_days & set(trade_dates), options_days & set(trade_dates)
+        else:
+            self._reconciled = True
+        known_stock, known_options = self.manifest.recorded_days()
+        return self._index_days(stock_days - known_stock, options_days - known_options)
+
+    def reindex(self):
+        """ Record every day on disk in the manifest, overwriting what it recorded for those days.
 
+        Returns:
+            list: Trading days indexed.
+        """
+        return self._index_days(self._days_on_disk("stock"), self._days_on_disk("options"))
+
+    def _index_days(self, stock_days, options_days):
+        for trade_date in sorted(options_days):
+            if self.storage == "parquet":
+                times = self.store.read_options(trade_date, columns = ["strike"]).loc[:, "time"]
+            else:
+                times = pd.read_csv(self._csv_path("options", trade_date), usecols = ["time"], parse_dates = ["time"]).loc[:, "time"]
+            rows = times.dt.strftime(Manifest.MINUTE_FORMAT).value_counts()
+            trade_minutes = self._options_trade_minutes(trade_date)
+            self.manifest.expect_day(trade_date, trade_minutes)
+            for trade_minute in sorted(set(trade_minutes) | {datetime.strptime(x, Manifest.MINUTE_FORMAT) for x in rows.index}):
+                self.manifest.record_snapshot(trade_minute, rows.get(trade_minute.strftime(Manifest.MINUTE_FORMAT)))
+        for trade_date in sorted(stock_days):
+            if self.storage == "parquet":
+                df_stock = self.store.read_stock(trade_date, columns = ["close"])
+            else:
+                df_stock = pd.read_csv(self._csv_path("stock", trade_date), usecols = ["datetime"])
+            self.manifest.record_stock_range(trade_date, *self._stock_range(trade_date), rows = len(df_stock))
+        return sorted(stock_days | options_days)
+
+    def read_data(self, trade_date, columns = None, filters = None):
+        """ Read the stored stock and options data of a trading day.
+
+        Args:
+            trade_date (datetime): Trading day.
+            columns (list): Options columns to load (`time` is always included), e.g.
+                ["strike", "stockPrice", "putBidPrice", "putAskPrice"]. Defaults to all columns.
+            filters (list): Row filters on the options data as (column, op, value) tuples, e.g.
+                [("strike", ">=", 450)], or a list of such lists whose rows are OR-ed (pyarrow's DNF form).
+                Pushed down to the Parquet reader with the "parquet" storage.
+
+        Returns:
+            tuple: (df_stock, df_options)
+        """
+        with instrumentation.timer(f"read_data.{self.storage}"):
+            if self.storage == "parquet":
+                df_stock, df_options = self.store.read_stock(trade_date), self.store.read_options(trade_date, columns = columns, filters = filters)
+            else:
+                df_stock = pd.read_csv(self._csv_path("stock", trade_date), parse_dates=['datetime'], index_col='datetime')
+                # Columns only filtered on are read too, then dropped, as the Parquet reader does
+                conjunctions = (filters if isinstance(filters[0], list) else [filters]) if filters else list()
+                usecols, filter_only = None, list()
+                if columns is not None:
+                    usecols = ["time"] + [x for x in columns if x != "time"]
+                    filter_only = list(dict.fromkeys(x[0] for conjunction in conjunctions for x in conjunction if x[0] not in usecols))
+                    usecols += filter_only + ["Unnamed: 0"]
+                df_options = pd.read_csv(self._csv_path("options", trade_date), parse_dates=['time'], usecols=usecols).drop(columns=['Unnamed: 0'])
+                if conjunctions:
+                    mask = np.any([np.all([self._filter_mask(df_options, *x) for x in conjunction], axis = 0) for conjunction in conjunctions], axis = 0)
+                    df_options = df_options[mask].reset_index(drop = True)
+                df_options = df_options.drop(columns = filter_only)
+        instrumentation.count("read_data.options_rows", len(df_options))
         return df_stock, df_options
-    
-    def read_data(self, trade_date):
-        df_stock = pd.read_csv(f"data/stock_data_{trade_date.strftime('%Y%m%d')}.csv", parse_dates=['datetime'], index_col='datetime')
-        df_options = pd.read_csv(f"data/options_data_{trade_date.strftime('%Y%m%d')}.csv", parse_dates=['time']).drop(columns=['Unnamed: 0'])
-        return df_stock, df_options
\ No newline at end of file
+
+    def options_dataset(self, columns = None, strike_band = None, filters = None):
+        """ Lazy `OptionsDataset` over the stored options, loading days or snapshots only as they are iterated.
+
+        Args:
+            columns (list): Options columns to load (`time` is always included). Defaults to all columns.
+            strike_band (float): Keep only strikes within this many dollars of the snapshot's stockPrice.
+            filters (list): Further row filters, as in `read_data`.
+        """
+        if self.storage != "parquet":
+            raise ValueError("OptionsDataset reads the Parquet store; migrate the CSV files with `python -m src.DataStore`")
+        return OptionsDataset(self.store, columns = columns, strike_band = strike_band, filters = filters)
+
+    @staticmethod
+    def _filter_mask(df, column, op, value):
+        match op:
+            case "==" | "=":
+                return df[column] == value
+            case "!=":
+                return df[column] != value
+            case "<":
+                return df[column] < value
+            case "<=":
+                return df[column] <= value
+            case ">":
+                return df[column] > value
+            case ">=":
+                return df[column] >= value
+            case "in":
+                return df[column].isin(value)
+            case "not in":
+                return ~df[column].isin(value)
+            case _:
+                raise ValueError(f"Unknown filter op: {op}")
@@ -1,25 +1,120 @@
+import numpy as np
 import pandas as pd
 from datetime import time
 from dateutil.relativedelta import relativedelta
 
+from src.Instrumentation import instrumentation
+from src.OptionsChain import OptionsChain
+
 class DayTrade:
-    def __init__(self, strategy, model_num, AUM, df_options, commission_dollars = 0.15, max_risk = 0.025, interval = 5):
+    TRADE_COLUMNS = ['entry_time', 'direction', 'entry_spot', 'entry_atm_strike',
+        'leg1_strike', 'leg2_strike', 'entry_leg1_price', 'entry_leg2_price',
+        'entry_unit_spread', 'entry_unit_maxloss', 'contracts', 'stoploss',
+        'exit_time', 'exit_spot', 'exit_leg1_price', 'exit_leg2_price',
+        'exit_unit_spread', 'exit_reason', 'unit_pnl_gross', 'pnl']
+    GROSS_TRADE_COLUMNS = [x for x in TRADE_COLUMNS if x not in ('contracts', 'pnl')] + ['model_num', 'sizing_unit_maxloss']
+    # Bump when a change alters the trades the engines return, so cached results (ResultCache) are recomputed
+    ENGINE_VERSION = 2
+
+    def __init__(self, strategy, model_num, AUM, df_options, commission_dollars = 0.15, max_risk = 0.025, interval = 5, chain = None, intraday_marks = None):
         self.params = strategy.get_models(model_num)
         self.df_options = df_options
         self.interval = interval
+        # Dense view of df_options used by the numpy engine; pass one in to share it across models of the same day
+        self._chain = chain
+        # IntradayMarks of the day: stop-losses are then also checked on every minute between snapshots (numpy engine)
+        self.intraday_marks = intraday_marks
 
         self.commission_dollars = commission_dollars
         self.max_risk = max_risk
         self.AUM = AUM
 
         self.strategy = strategy
-        enter_long, exit_long, enter_short, exit_short = strategy.entry_exit_signals(model_num = model_num)
+        self.strike_lookups = 0 # strike searches in the chain by `_step`, reported to instrumentation
+        enter_long, exit_long, enter_short, exit_short = strategy.model_signals(model_num)
         self.enter_long = enter_long
         self.exit_long = exit_long
         self.enter_short = enter_short
         self.exit_short = exit_short
 
-    def trade(self):
+    @property
+    def chain(self):
+        if self._chain is None:
+            self._chain = OptionsChain(self.df_options)
+        return self._chain
+
+    def trade(self, engine = "numpy"):
+        """ Trade a full day and return one row per trade.
+
+        Args:
+            engine (str): "numpy" runs on the dense `OptionsChain` arrays, "pandas" is the original
+                DataFrame-scanning implementation kept as a reference. Both return the same trades.
+
+        A position still open at the end of the day is closed ("end_of_time") at the last traded snapshot
+        where both of its legs were quoted, so a leg missing from the final snapshot never gives a NaN exit.
+        `trade_all` follows the same rule.
+
+        Returns:
+            pd.DataFrame: Trades with the columns in `DayTrade.TRADE_COLUMNS`.
+        """
+        match engine:
+            case "numpy":
+                with instrumentation.timer("daytrade.trade"):
+                    return self._trade_numpy()
+            case "pandas":
+                if self.intraday_marks is not None:
+                    raise ValueError("intraday_marks are only supported by the numpy engine")
+                return self._trade_pandas()
+            case _:
+                raise ValueError(f"Unknown engine: {engine}")
+
+    def _trade_numpy(self):
+        max_risk_dollars = self.AUM * self.max_risk
+        chain = self.chain
+
+        # Timeline: snapshots that also have indicator values
+        signal_times = self.strategy.tech_indicators.index
+        tradeable_instances = np.flatnonzero(chain.times.isin(signal_times))
+        if len(tradeable_instances) == 0:
+            return pd.DataFrame(columns = self.TRADE_COLUMNS)
+        instance_times = chain.times[tradeable_instances]
+        can_enter = np.array([x.time() < time(14, 30) for x in instance_times], dtype = bool)
+
+        # Latest signal strictly before each instance
+        signal_pos = signal_times.searchsorted(instance_times, side = "left") - 1
+        enter_long = self.enter_long.to_numpy(dtype = bool)
+        enter_short = self.enter_short.to_numpy(dtype = bool)
+
+        # Any exit signal in [prev_instance, instance), counted with prefix sums
+        prev_instance = instance_times[0] - relativedelta(minutes = self.interval)
+        window_start = signal_times.searchsorted(prev_instance, side = "left")
+        window_end = signal_times.searchsorted(instance_times, side = "left")
+        exit_long_count = np.concatenate([[0], np.cumsum(self.exit_long.to_numpy(dtype = bool))])
+        exit_short_count = np.concatenate([[0], np.cumsum(self.exit_short.to_numpy(dtype = bool))])
+        exit_long = exit_long_count[window_end] - exit_long_count[window_start] > 0
+        exit_short = exit_short_count[window_end] - exit_short_count[window_start] > 0
+
+        self.position = 0
+        self.trades = list()
+        self.strike_lookups = 0
+        for i, t in enumerate(tradeable_instances):
+            has_signal = signal_pos[i] >= 0
+            self._step(chain, t,
+                can_enter = can_enter[i] and has_signal,
+                enter_long = has_signal and enter_long[signal_pos[i]],
+                enter_short = has_signal and enter_short[signal_pos[i]],
+                exit_long = exit_long[i],
+                exit_short = exit_short[i],
+                max_risk_dollars = max_risk_dollars)
+            if self.intraday_marks is not None and self.position != 0 and i + 1 < len(tradeable_instances):
+                self._check_intraday_stoploss(chain.times[t], chain.times[tradeable_instances[i + 1]])
+        self._close_position()
+        instrumentation.count("daytrade.steps", len(tradeable_instances))
+        instrumentation.count("daytrade.strike_lookups", self.strike_lookups)
+        instrumentation.count("daytrade.trades", len(self.trades))
+        return self._trades_frame()
+
+    def _trade_pandas(self):
         max_risk_dollars = self.AUM * self.max_risk
 
         # Initiations
@@ -42,6 +137,7 @@ class DayTrade:
                             else:
                                 trades.append(metadata)
                                 position = 1
+                                last_quoted = df_options_instance
                         elif self.enter_short[(self.enter_short.index < trade_instance)].iloc[-1]:
                             metadata = self.open_short_trade(df_options_instance, self.params, max_risk_dollars)
                             if metadata is None:
@@ -49,10 +145,12 @@ class DayTrade:
                             else:
                                 trades.append(metadata)
                                 position = -1
+                                last_quoted = df_options_instance
                 case 1:
                     latest_trade = trades[-1]
                     if (latest_trade["leg1_strike"] not in df_options_instance.loc[:, "strike"].unique()) or (latest_trade["leg2_strike"] not in df_options_instance.loc[:, "strike"].unique()):
                         continue
+                    last_quoted = df_options_instance
                     # exit long criteria
                     exit_signal = self.exit_long[(self.exit_long.index < trade_instance) & (self.exit_long.index >= prev_instance)].any()
                     # stoploss hit
@@ -65,6 +163,7 @@ class DayTrade:
                     latest_trade = trades[-1]
                     if (latest_trade["leg1_strike"] not in df_options_instance.loc[:, "strike"].unique()) or (latest_trade["leg2_strike"] not in df_options_instance.loc[:, "strike"].unique()):
                         continue
+                    last_quoted = df_options_instance
                     # exit short criteria
                     exit_signal = self.exit_short[(self.exit_short.index < trade_instance) & (self.exit_short.index >= prev_instance)].any()
                     # stoploss hit
@@ -75,18 +174,15 @@ class DayTrade:
                         position = 0
                 case _:
                     raise ValueError("Invalid position value.")
+        # End of day: close at the last snapshot where both legs were quoted
         if position == 1:
-            trades[-1] |= self.close_long_trade(df_options_instance, latest_trade, reason = "end_of_time")
+            trades[-1] |= self.close_long_trade(last_quoted, trades[-1], reason = "end_of_time")
         elif position == -1:
-            trades[-1] |= self.close_short_trade(df_options_instance, latest_trade, reason = "end_of_time")
+            trades[-1] |= self.close_short_trade(last_quoted, trades[-1], reason = "end_of_time")
         if len(trades) > 0:
             trades = pd.DataFrame(trades)
         else:
-            trades = pd.DataFrame(columns = ['entry_time', 'direction', 'entry_spot', 'entry_atm_strike',
-                'leg1_strike', 'leg2_strike', 'entry_leg1_price', 'entry_leg2_price',
-                'entry_unit_spread', 'entry_unit_maxloss', 'contracts', 'stoploss',
-                'exit_time', 'exit_spot', 'exit_leg1_price', 'exit_leg2_price',
-                'exit_unit_spread', 'exit_reason', 'unit_pnl_gross', 'pnl'])
+            trades = pd.DataFrame(columns = self.TRADE_COLUMNS)
         return trades
 
     # Helper functions
@@ -252,4 +348,357 @@ class DayTrade:
             "stoploss": round(stoploss, 6)
         }
 
-        return metadata
\ No newline at end of file
+        return metadata
+
+    # Numpy engine helpers, mirroring the pandas helpers above on OptionsChain arrays
+    @staticmethod
+    def _leg_columns(direction):
+        """ (leg1 exit, leg2 exit, leg1 entry, leg2 entry) quote columns for a spread direction. """
+        if direction == 1:
+            return "putAskPrice", "putBidPrice", "putBidPrice", "putAskPrice"
+        return "callAskPrice", "callBidPrice", "callBidPrice", "callAskPrice"
+
+    def _spread_exit_price_numpy(self, chain, t, latest_trade):
+        leg1_column, leg2_column, _, _ = self._leg_columns(latest_trade["direction"])
+        return chain.quote(leg1_column, t, latest_trade["leg1_k"]) - chain.quote(leg2_column, t, latest_trade["leg2_k"])
+
+    def _open_trade_numpy(self, chain, t, direction, params, max_risk_dollars):
+        # Current info
+        current_spot = chain.spot[t]
+        atm_k = chain.nearest_strike_index(t, current_spot)
+        leg1_k = chain.nearest_strike_index(t, chain.strikes[atm_k] - direction * params["opt_leg1_dollar_from_atm"])
+        leg2_k = chain.nearest_strike_index(t, chain.strikes[leg1_k] - direction * params["opt_leg2_dollar_from_leg1"])
+        leg1_strike = float(chain.strikes[leg1_k])
+        leg2_strike = float(chain.strikes[leg2_k])
+        leg1_exit_column, leg2_exit_column, leg1_entry_column, leg2_entry_column = self._leg_columns(direction)
+
+        # Positioning
+        unit_spread = chain.quote(leg1_entry_column, t, leg1_k) - chain.quote(leg2_entry_column, t, leg2_k)
+        unit_maxloss = direction * (leg1_strike - leg2_strike) - unit_spread
+        contracts = int(max_risk_dollars / 100 / unit_maxloss * 0.75) # set a 75% cap on max_risk - while avoiding large contract sizes
+        stoploss = unit_spread + unit_spread * params["stoploss_pct_of_maxprofit"]
+
+        # Validations
+        if not (unit_spread > 0.01):
+            return None
+        if not (chain.quote(leg1_exit_column, t, leg1_k) - chain.quote(leg2_exit_column, t, leg2_k) < stoploss):
+            return None
+
+        # Metadata (entry leg prices are recorded from the put quotes for both directions, as in open_short_trade)
+        metadata = {
+            "entry_time": chain.times[t],
+            "direction" : direction,
+            "entry_spot": current_spot,
+            "entry_atm_strike": chain.strikes[atm_k],
+            "leg1_strike": leg1_strike,
+            "leg2_strike": leg2_strike,
+            "entry_leg1_price": chain.quote("putBidPrice", t, leg1_k),
+            "entry_leg2_price": chain.quote("putAskPrice", t, leg2_k),
+            "entry_unit_spread": round(unit_spread, 6),
+            "entry_unit_maxloss": round(unit_maxloss, 6),
+            "contracts": contracts,
+            "stoploss": round(stoploss, 6),
+            "leg1_k": leg1_k,
+            "leg2_k": leg2_k,
+        }
+
+        return metadata
+
+    def _close_trade_numpy(self, chain, t, latest_trade, reason):
+        leg1_column, leg2_column, _, _ = self._leg_columns(latest_trade["direction"])
+        leg1_price = chain.quote(leg1_column, t, latest_trade["leg1_k"])
+        leg2_price = chain.quote(leg2_column, t, latest_trade["leg2_k"])
+
+        # Info
+        exit_price = leg1_price - leg2_price
+        unit_pnl_gross = latest_trade["entry_unit_spread"] - exit_price # credit spread
+        pnl = unit_pnl_gross * latest_trade["contracts"] * 100 - self.commission_dollars * 4 * latest_trade["contracts"]
+
+        # Update trade info
+        metadata_update = {
+            "exit_time": chain.times[t],
+            "exit_spot": chain.spot[t],
+            "exit_leg1_price": leg1_price,
+            "exit_leg2_price": leg2_price,
+            "exit_unit_spread": exit_price,
+            "exit_reason": reason,
+            "unit_pnl_gross": unit_pnl_gross,
+            "pnl" : pnl
+        }
+
+        return metadata_update
+
+    def _step(self, chain, t, can_enter, enter_long, enter_short, exit_long, exit_short, max_risk_dollars):
+        """ Advance the position state machine on tradeable snapshot `t` of `chain`.
+
+        Shared by the numpy engine and the event-driven `LiveDayTrade`, which passes one-snapshot chains;
+        open legs are therefore looked up by strike on every call.
+
+        Returns:
+            str: "open" or "close" if a trade was opened or closed on this snapshot, else None.
+        """
+        match self.position:
+            case 0:
+                direction = 1 if enter_long else -1 if enter_short else 0
+                if can_enter and direction != 0:
+                    self.strike_lookups += 3 # ATM and both legs
+                    metadata = self._open_trade_numpy(chain, t, direction, self.params, max_risk_dollars)
+                    if metadata is not None:
+                        self.trades.append(metadata)
+                        self.position = direction
+                        self.last_quoted = (chain, t)
+                        return "open"
+            case 1 | -1:
+                self.strike_lookups += 2
+                latest_trade = self._locate_legs(chain, self.trades[-1])
+                if min(latest_trade["leg1_k"], latest_trade["leg2_k"]) < 0 or not (chain.available[t, latest_trade["leg1_k"]] and chain.available[t, latest_trade["leg2_k"]]):
+                    return None
+                self.last_quoted = (chain, t)
+                exit_signal = exit_long if self.position == 1 else exit_short
+                stoploss_hit = self._spread_exit_price_numpy(chain, t, latest_trade) >= latest_trade["stoploss"]
+                if exit_signal or stoploss_hit:
+                    self.trades[-1] |= self._close_trade_numpy(chain, t, latest_trade, reason = "exit_criteria" if exit_signal else "stoploss")
+                    self.position = 0
+                    return "close"
+            case _:
+                raise ValueError("Invalid position value.")
+        return None
+
+    def _check_intraday_stoploss(self, start_time, end_time):
+        """ Close the open position at the first minute strictly between two snapshots whose marked exit
+        price reaches the stop-loss. Exits are recorded at the marks with reason "stoploss_intraday".
+        """
+        marks = self.intraday_marks.chain
+        latest_trade = self._locate_legs(marks, self.trades[-1])
+        leg1_k, leg2_k = latest_trade["leg1_k"], latest_trade["leg2_k"]
+        minutes = self.intraday_marks.minutes_between(start_time, end_time)
+        if min(leg1_k, leg2_k) < 0 or len(minutes) == 0:
+            return None
+        leg1_column, leg2_column, _, _ = self._leg_columns(latest_trade["direction"])
+        exit_price = marks.quotes[leg1_column][minutes, leg1_k] - marks.quotes[leg2_column][minutes, leg2_k]
+        hit = np.flatnonzero(exit_price >= latest_trade["stoploss"])
+        if len(hit) == 0:
+            return None
+        self.trades[-1] |= self._close_trade_numpy(marks, minutes[hit[0]], latest_trade, reason = "stoploss_intraday")
+        self.position = 0
+        return "close"
+
+    def _close_position(self):
+        """ Close the open position, if any, at the end of the day. The close is at the last snapshot
+        stepped through `_step` where both legs were quoted, as in the other engines.
+        """
+        if self.position == 0:
+            return None
+        chain, t = self.last_quoted
+        latest_trade = self._locate_legs(chain, self.trades[-1])
+        self.trades[-1] |= self._close_trade_numpy(chain, t, latest_trade, reason = "end_of_time")
+        self.position = 0
+        return "close"
+
+    @staticmethod
+    def _locate_legs(chain, latest_trade):
+        latest_trade["leg1_k"] = chain.strike_index(latest_trade["leg1_strike"])
+        latest_trade["leg2_k"] = chain.strike_index(latest_trade["leg2_strike"])
+        return latest_trade
+
+    def _trades_frame(self):
+        if len(self.trades) == 0:
+            return pd.DataFrame(columns = self.TRADE_COLUMNS)
+        return pd.DataFrame([{key: value for key, value in x.items() if key not in ("leg1_k", "leg2_k")} for x in self.trades])
+
+    # Batched engine: every model of a Strategy stepped together over one day
+    @classmethod
+    def trade_all(cls, strategy, df_options, aums, commission_dollars = 0.15, max_risk = 0.025, interval = 5, chain = None):
+        """ Trade a full day for every model of `strategy` in one pass.
+
+        Signals of every model come from one `Strategy.signal_matrix` pass, one column per signal config, and
+        the position state machines of all models are stepped forward together as arrays. The result is
+        the same as running `DayTrade(strategy, model_num, aums[model_num], ...).trade()` for each model.
+
+        Args:
+            strategy (Strategy): Strategy with `compute_tech_indicators` already run for the day.
+            df_options (pd.DataFrame): Day of options data from `DataUpdateModule.read_data`.
+            aums (list): Starting AUM of each model, indexed by model number.
+            chain (OptionsChain): Optional prebuilt chain for `df_options`.
+
+        Returns:
+            pd.DataFrame: Trades of all models with the columns in `DayTrade.TRADE_COLUMNS` plus
+                `model_num`, ordered by model number then entry time.
+        """
+        gross_trades = cls.trade_all_gross(strategy, df_options, interval = interval, chain = chain)
+        return cls.size_trades(gross_trades, aums, commission_dollars = commission_dollars, max_risk = max_risk)
+
+    @classmethod
+    def trade_all_gross(cls, strategy, df_options, interval = 5, chain = None):
+        """ Entry/exit decisions of every model for a day, before position sizing.
+
+        Trade decisions do not depend on AUM, commission or max_risk; those only enter through
+        `size_trades`. The returned frame has every trade column except `contracts` and `pnl`, plus
+        `sizing_unit_maxloss`, the unrounded max loss used to size the position.
+        """
+        with instrumentation.timer("daytrade.trade_all_gross"):
+            return cls._trade_all_gross(strategy, df_options, interval, chain)
+
+    @classmethod
+    def _trade_all_gross(cls, strategy, df_options, interval, chain):
+        if chain is None:
+            chain = OptionsChain(df_options)
+        models = strategy.get_models()
+        n_models = len(models)
+
+        # Timeline shared by all models
+        signal_times = strategy.tech_indicators.index
+        tradeable_instances = np.flatnonzero(chain.times.isin(signal_times))
+        if len(tradeable_instances) == 0 or n_models == 0:
+            return pd.DataFrame(columns = cls.GROSS_TRADE_COLUMNS)
+        instance_times = chain.times[tradeable_instances]
+        can_enter = np.array([x.time() < time(14, 30) for x in instance_times], dtype = bool)
+        signal_pos = signal_times.searchsorted(instance_times, side = "left") - 1
+        prev_instance = instance_times[0] - relativedelta(minutes = interval)
+        window_start = signal_times.searchsorted(prev_instance, side = "left")
+        window_end = signal_times.searchsorted(instance_times, side = "left")
+
+        # Signals on the timeline, one row per signal group
+        signals, model_group = strategy.signal_matrix()
+        has_signal = signal_pos >= 0
+        enter_long = np.zeros((signals.shape[1], len(tradeable_instances)), dtype = bool)
+        enter_short = np.zeros_like(enter_long)
+        enter_long[:, has_signal] = signals[signal_pos[has_signal], :, 0].T
+        enter_short[:, has_signal] = signals[signal_pos[has_signal], :, 2].T
+        exit_count = np.concatenate([np.zeros((1, signals.shape[1], 4), dtype = int), np.cumsum(signals, axis = 0)])
+        exit_long = (exit_count[window_end, :, 1] - exit_count[window_start, :, 1] > 0).T
+        exit_short = (exit_count[window_end, :, 3] - exit_count[window_start, :, 3] > 0).T
+
+        leg1_offset = np.array([x["opt_leg1_dollar_from_atm"] for x in models], dtype = float)
+        leg2_offset = np.array([x["opt_leg2_dollar_from_leg1"] for x in models], dtype = float)
+        stoploss_pct = np.array([x["stoploss_pct_of_maxprofit"] for x in models], dtype = float)
+        put_bid, put_ask = chain.quotes["putBidPrice"], chain.quotes["putAskPrice"]
+        call_bid, call_ask = chain.quotes["callBidPrice"], chain.quotes["callAskPrice"]
+
+        # Position state of every model
+        strike_lookups = 0
+        position = np.zeros(n_models, dtype = int)
+        open_trade = np.full(n_models, -1)
+        leg1_k = np.zeros(n_models, dtype = int)
+        leg2_k = np.zeros(n_models, dtype = int)
+        stoploss = np.zeros(n_models)
+        last_quoted = np.zeros(n_models, dtype = int) # last snapshot where both legs of the open position were quoted
+        entered = {x: list() for x in ["model_num", "direction", "t", "atm_k", "leg1_k", "leg2_k", "unit_spread", "unit_maxloss", "stoploss"]}
+        exited = {"t": list(), "reason": list()}
+
+        def close(model_nums, t, reason):
+            for m in model_nums:
+                exited["t"][open_trade[m]] = t
+                exited["reason"][open_trade[m]] = reason
+            position[model_nums] = 0
+
+        for i, t in enumerate(tradeable_instances):
+            flat = np.flatnonzero(position == 0)
+
+            # Held positions: exit criteria or stoploss, skipping snapshots missing a leg
+            held = np.flatnonzero(position != 0)
+            held = held[chain.available[t, leg1_k[held]] & chain.available[t, leg2_k[held]]]
+            last_quoted[held] = t
+            if len(held) > 0:
+                is_long = position[held] == 1
+                exit_signal = np.where(is_long, exit_long[model_group[held], i], exit_short[model_group[held], i])
+                current_price = np.where(is_long, put_ask[t, leg1_k[held]], call_ask[t, leg1_k[held]]) \
+                    - np.where(is_long, put_bid[t, leg2_k[held]], call_bid[t, leg2_k[held]])
+                stoploss_hit = current_price >= stoploss[held]
+                close(held[exit_signal], t, "exit_criteria")
+                close(held[~exit_signal & stoploss_hit], t, "stoploss")
+
+            # Flat models: entries
+            if not can_enter[i] or not has_signal[i] or len(flat) == 0:
+                continue
+            go_long = enter_long[model_group[flat], i]
+            go_short = ~go_long & enter_short[model_group[flat], i]
+            candidates = flat[go_long | go_short]
+            if len(candidates) == 0:
+                continue
+            direction = np.where(go_long[go_long | go_short], 1, -1)
+            is_long = direction == 1
+            strike_lookups += 1 + 2 * len(candidates)
+            atm_k = chain.nearest_strike_index(t, chain.spot[t])
+            candidate_leg1_k = chain.nearest_strike_indices(t, chain.strikes[atm_k] - direction * leg1_offset[candidates])
+            candidate_leg2_k = chain.nearest_strike_indices(t, chain.strikes[candidate_leg1_k] - direction * leg2_offset[candidates])
+            unit_spread = np.where(is_long, put_bid[t, candidate_leg1_k], call_bid[t, candidate_leg1_k]) \
+                - np.where(is_long, put_ask[t, candidate_leg2_k], call_ask[t, candidate_leg2_k])
+            unit_maxloss = direction * (chain.strikes[candidate_leg1_k] - chain.strikes[candidate_leg2_k]) - unit_spread
+            candidate_stoploss = unit_spread + unit_spread * stoploss_pct[candidates]
+            exit_price = np.where(is_long, put_ask[t, candidate_leg1_k], call_ask[t, candidate_leg1_k]) \
+                - np.where(is_long, put_bid[t, candidate_leg2_k], call_bid[t, candidate_leg2_k])
+            opened = (unit_spread > 0.01) & (exit_price < candidate_stoploss)
+
+            for j in np.flatnonzero(opened):
+                m = candidates[j]
+                open_trade[m] = len(entered["model_num"])
+                position[m] = direction[j]
+                last_quoted[m] = t
+                leg1_k[m] = candidate_leg1_k[j]
+                leg2_k[m] = candidate_leg2_k[j]
+                stoploss[m] = round(float(candidate_stoploss[j]), 6)
+                for key, value in zip(entered.keys(), [m, direction[j], t, atm_k, leg1_k[m], leg2_k[m], unit_spread[j], unit_maxloss[j], stoploss[m]]):
+                    entered[key].append(value)
+                exited["t"].append(-1)
+                exited["reason"].append(None)
+        for m in np.flatnonzero(position != 0):
+            close([m], last_quoted[m], "end_of_time")
+        instrumentation.count("daytrade.batched_steps", len(tradeable_instances))
+        instrumentation.count("daytrade.model_steps", len(tradeable_instances) * n_models)
+        instrumentation.count("daytrade.strike_lookups", strike_lookups)
+        instrumentation.count("daytrade.trades", len(exited["t"]))
+
+        # Assemble, ordered as if the models had been traded one after another
+        entered = {key: np.array(value) for key, value in entered.items()}
+        exit_t = np.array(exited["t"], dtype = int)
+        if len(exit_t) == 0:
+            return pd.DataFrame(columns = cls.GROSS_TRADE_COLUMNS)
+        is_long = entered["direction"] == 1
+        t_in, k1, k2 = entered["t"], entered["leg1_k"], entered["leg2_k"]
+        entry_unit_spread = np.array([round(float(x), 6) for x in entered["unit_spread"]])
+        exit_unit_spread = np.where(is_long, put_ask[exit_t, k1], call_ask[exit_t, k1]) - np.where(is_long, put_bid[exit_t, k2], call_bid[exit_t, k2])
+        gross_trades = pd.DataFrame({
+            "entry_time": chain.times[t_in],
+            "direction": entered["direction"],
+            "entry_spot": chain.spot[t_in],
+            "entry_atm_strike": chain.strikes[entered["atm_k"]],
+            "leg1_strike": chain.strikes[k1],
+            "leg2_strike": chain.strikes[k2],
+            "entry_leg1_price": put_bid[t_in, k1],
+            "entry_leg2_price": put_ask[t_in, k2],
+            "entry_unit_spread": entry_unit_spread,
+            "entry_unit_maxloss": np.array([round(float(x), 6) for x in entered["unit_maxloss"]]),
+            "stoploss": entered["stoploss"],
+            "exit_time": chain.times[exit_t],
+            "exit_spot": chain.spot[exit_t],
+            "exit_leg1_price": np.where(is_long, put_ask[exit_t, k1], call_ask[exit_t, k1]),
+            "exit_leg2_price": np.where(is_long, put_bid[exit_t, k2], call_bid[exit_t, k2]),
+            "exit_unit_spread": exit_unit_spread,
+            "exit_reason": exited["reason"],
+            "unit_pnl_gross": entry_unit_spread - exit_unit_spread,
+            "model_num": entered["model_num"],
+            "sizing_unit_maxloss": entered["unit_maxloss"],
+        })
+        return gross_trades.iloc[np.lexsort([t_in, entered["model_num"]])].reset_index(drop = True)
+
+    @classmethod
+    def size_trades(cls, gross_trades, aums, commission_dollars = 0.15, max_risk = 0.025):
+        """ Size the trades of `trade_all_gross` and compute their PnL.
+
+        Args:
+            gross_trades (pd.DataFrame): Output of `trade_all_gross`.
+            aums (list): Starting AUM of each model for the day, indexed by model number.
+
+        Returns:
+            pd.DataFrame: Trades with the columns in `DayTrade.TRADE_COLUMNS` plus `model_num`.
+        """
+        instrumentation.count("daytrade.sized_trades", len(gross_trades))
+        max_risk_dollars = np.asarray(aums, dtype = float)[gross_trades.loc[:, "model_num"].to_numpy(dtype = int)] * max_risk
+        unit_maxloss = gross_trades.loc[:, "sizing_unit_maxloss"].to_numpy(dtype = float)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            contracts = max_risk_dollars / 100 / unit_maxloss * 0.75 # set a 75% cap on max_risk - while avoiding large contract sizes
+        contracts = np.trunc(np.where(np.isfinite(contracts), contracts, 0)).astype(int)
+        pnl = gross_trades.loc[:, "unit_pnl_gross"].to_numpy(dtype = float) * contracts * 100 - commission_dollars * 4 * contracts
+        trades = gross_trades.assign(contracts = contracts, pnl = pnl)
+        return trades.loc[:, cls.TRADE_COLUMNS + ["model_num"]]
@@ -0,0 +1,184 @@
+import argparse
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+from src.DataStore import DataStore
+from src.DataUpdateModule import DataUpdateModule
+from src.DayTrade import DayTrade
+from src.LiveDayTrade import LiveDayTrade
+from src.OptionsChain import OptionsChain
+from src.Strategy import Strategy
+from src.SyntheticData import SyntheticData
+from src.WalkForward import WalkForward
+
+class Equivalence:
+    """ Checks, on synthetic data, that the equivalent code paths of the backtest agree exactly.
+
+        store        ORATS responses through `DataUpdateModule._parse_options_data`, `DataStore.write_options`
+                     and `read_options`, stock bars through `write_stock` / `read_stock`, and chains through
+                     `OptionsChain.to_arrays` / `from_arrays` keep their times and quotes
+        engines      the numpy and pandas `DayTrade` engines, `DayTrade.trade_all` and `LiveDayTrade.replay`
+                     return identical trades for every model and day
+        walk_forward `WalkForward.run` with one and with `max_workers` processes returns what the notebook loop
+                     (`DayTrade` per model and day) does
+
+    Each check raises AssertionError on the first difference, or when there were no trades to compare,
+    and returns what it compared.
+
+        python -m src.Equivalence --days 3 --workers 2
+    """
+    # Small grid whose every model trades, and hits stop-losses, on the synthetic days
+    PARAMS_GRID = {
+        "fast": [5, 10],
+        "slow_mult": [2],
+        "rsi_threshold": [60, 70],
+        "opt_leg1_dollar_from_atm": [0],
+        "opt_leg2_dollar_from_leg1": [1, 5],
+        "stoploss_pct_of_maxprofit": [.5],
+    }
+
+    def __init__(self, params_grid = PARAMS_GRID, n_days = 3, interval = 5, width = 30, max_workers = 2, seed = 0, AUM = 6.5 * 1e6):
+        self.strategy = Strategy(params_grid = params_grid)
+        self.n_days = n_days
+        self.interval = interval
+        self.width = width
+        self.max_workers = max_workers
+        self.AUM = AUM
+        self.synthetic = SyntheticData(seed = seed)
+
+    def trade_dates(self, months = (1,)):
+        """ First `n_days` weekdays of each month (of 2022). """
+        return [x.to_pydatetime() for month in months for x in pd.bdate_range(datetime(2022, month, 3), periods = self.n_days)]
+
+    @staticmethod
+    def _orats_response(snapshot):
+        """ Body of an ORATS response carrying a synthetic snapshot, as `OratsFetcher.fetch` returns it. """
+        return snapshot.drop(columns = ["time", "putDelta"]).rename(columns = {"callDelta": "delta"}).assign(dte = 1).to_csv(index = False).encode()
+
+    def check_store(self, store_root):
+        """ Returns: dict: Snapshots and stock bars compared. """
+        store = DataStore(store_root)
+        n_snapshots = n_bars = 0
+        for trade_date in self.trade_dates():
+            df_stock, df_options = self.synthetic.day(trade_date, interval = self.interval, width = self.width)
+            parsed = pd.concat([
+                DataUpdateModule._parse_options_data(self._orats_response(snapshot), time.tz_localize(None).to_pydatetime())
+                for time, snapshot in df_options.groupby("time", sort = True)
+            ])
+            store.write_options(trade_date, parsed)
+            read = store.read_options(trade_date)
+            assert read.loc[:, "time"].tolist() == df_options.loc[:, "time"].tolist(), f"{trade_date:%Y-%m-%d}: snapshot times changed in the store"
+            pd.testing.assert_frame_equal(read.loc[:, OptionsChain.QUOTE_COLUMNS + ["strike", "stockPrice"]], df_options.loc[:, OptionsChain.QUOTE_COLUMNS + ["strike", "stockPrice"]].reset_index(drop = True), check_exact = True)
+
+            chain = OptionsChain(parsed)
+            rebuilt = OptionsChain.from_arrays(chain.to_arrays(), chain.times.tz)
+            assert rebuilt.times.tolist() == chain.times.tolist(), f"{trade_date:%Y-%m-%d}: snapshot times changed in OptionsChain.to_arrays"
+
+            df_stock.index = df_stock.index.as_unit("us")
+            store.write_stock(trade_date, df_stock)
+            assert store.read_stock(trade_date).index.tolist() == df_stock.index.tolist(), f"{trade_date:%Y-%m-%d}: bar times changed in the store"
+            n_snapshots += len(chain)
+            n_bars += len(df_stock)
+        return {"snapshots": n_snapshots, "bars": n_bars}
+
+    def check_engines(self):
+        """ Returns: dict: Model-days and trades compared. """
+        n_models = len(self.strategy.get_models())
+        aums = [self.AUM + 12345. * x for x in range(n_models)]
+        n_trades = 0
+        for trade_date in self.trade_dates():
+            df_stock, df_options = self.synthetic.day(trade_date, interval = self.interval, width = self.width)
+            self.strategy.compute_tech_indicators(df_stock)
+            chain = OptionsChain(df_options)
+            reference = list()
+            for model_num in range(n_models):
+                trades = DayTrade(self.strategy, model_num, aums[model_num], df_options, interval = self.interval, chain = chain).trade()
+                pandas_trades = DayTrade(self.strategy, model_num, aums[model_num], df_options, interval = self.interval).trade(engine = "pandas")
+                live_trades = LiveDayTrade(self.strategy, model_num, aums[model_num], interval = self.interval).replay(df_stock, df_options)
+                for other in [pandas_trades, live_trades]:
+                    assert len(other) == len(trades), f"{trade_date:%Y-%m-%d} model {model_num}: {len(other)} trades instead of {len(trades)}"
+                    if len(trades) > 0:
+                        pd.testing.assert_frame_equal(other, trades, check_exact = True)
+                if len(trades) > 0:
+                    reference.append(trades.assign(model_num = model_num))
+                n_trades += len(trades)
+            batched = DayTrade.trade_all(self.strategy, df_options, aums, interval = self.interval, chain = chain)
+            pd.testing.assert_frame_equal(batched, pd.concat(reference).reset_index(drop = True), check_exact = True)
+        assert n_trades > 0, "no trades to compare; use a params grid that trades on the synthetic days"
+        return {"model_days": n_models * self.n_days, "trades": n_trades}
+
+    def _notebook_walk_forward(self, data_module, past_days, trade_days):
+        """ Training PnL, best model and trades of one month, with the per-model loop of the notebooks. """
+        models_AUM = [self.AUM] * len(self.strategy.get_models())
+        training = list()
+        for trade_day in past_days:
+            df_stock, df_options = data_module.read_data(trade_day)
+            self.strategy.compute_tech_indicators(df_stock)
+            pnls = list()
+            for model_num in range(len(models_AUM)):
+                trades = DayTrade(self.strategy, model_num, models_AUM[model_num], df_options, interval = self.interval).trade()
+                pnls.append(trades.loc[:, "pnl"].sum() if len(trades) > 0 else 0)
+                models_AUM[model_num] += pnls[-1]
+            training.append(pd.DataFrame([self.strategy.get_models(x) | {"pnl" : pnls[x], "model_num" : x} for x in range(len(pnls))]).assign(day = trade_day))
+        training = pd.concat(training)
+        best_model = WalkForward.rank_models(training).index[0]
+
+        AUMs = [self.AUM]
+        all_trades = list()
+        for trade_day in trade_days:
+            df_stock, df_options = data_module.read_data(trade_day)
+            self.strategy.compute_tech_indicators(df_stock)
+            trades = DayTrade(self.strategy, best_model, AUMs[-1], df_options, interval = self.interval).trade()
+            AUMs.append(AUMs[-1] + (trades.loc[:, "pnl"].sum() if len(trades) > 0 else 0))
+            all_trades.append(trades)
+        return training, best_model, AUMs, pd.concat(all_trades)
+
+    def check_walk_forward(self, data_dir):
+        """ Returns: dict: Model-days and trades compared. """
+        data_module = DataUpdateModule(options_interval_minutes = self.interval, data_dir = data_dir)
+        past_days, trade_days = self.trade_dates(months = (1,)), self.trade_dates(months = (2,))
+        self.synthetic.write(data_module.store, past_days + trade_days, interval = self.interval, width = self.width)
+        trade_month = datetime(2022, 2, 1)
+        training, best_model, AUMs, trades = self._notebook_walk_forward(data_module, past_days, trade_days)
+        try:
+            for max_workers in [1, self.max_workers]:
+                walk_forward = WalkForward(self.strategy, data_module, initial_aum = self.AUM, interval = self.interval, max_workers = max_workers)
+                results = walk_forward.run([trade_month])
+                pd.testing.assert_frame_equal(results["training"][datetime(2022, 1, 1)], training, check_exact = True)
+                assert results["trade_summary"].loc[:, "model_num"].eq(best_model).all(), f"max_workers = {max_workers}: model {results['trade_summary'].loc[0, 'model_num']} picked instead of {best_model}"
+                assert results["aums"] == AUMs, f"max_workers = {max_workers}: AUMs {results['aums']} instead of {AUMs}"
+                pd.testing.assert_frame_equal(results["trades"].reset_index(drop = True), trades.reset_index(drop = True), check_exact = True, check_dtype = False)
+        finally:
+            data_module.manifest.close()
+        assert len(trades) > 0, "the selected model made no trades to compare"
+        return {"model_days": len(training) + len(trade_days), "trades": len(trades)}
+
+    def run(self, verbose = True):
+        """ Run every check.
+
+        Returns:
+            dict: Maps each check to what it compared.
+        """
+        results = dict()
+        with tempfile.TemporaryDirectory() as root:
+            results["store"] = self.check_store(root)
+        results["engines"] = self.check_engines()
+        with tempfile.TemporaryDirectory() as data_dir:
+            results["walk_forward"] = self.check_walk_forward(data_dir)
+        if verbose:
+            for check, compared in results.items():
+                print(f"{check}: OK (" + ", ".join(f"{x}={y}" for x, y in compared.items()) + ")")
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Check that the equivalent backtest code paths agree exactly on synthetic data.")
+    parser.add_argument("--days", type = int, default = 3)
+    parser.add_argument("--interval", type = int, default = 5)
+    parser.add_argument("--width", type = int, default = 30)
+    parser.add_argument("--workers", type = int, default = 2)
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+    Equivalence(n_days = args.days, interval = args.interval, width = args.width, max_workers = args.workers, seed = args.seed).run()
@@ -0,0 +1,101 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import ta
+
+from src.Instrumentation import instrumentation
+
+class IndicatorCache:
+    """ LRU cache of technical indicator series keyed by (stock data fingerprint, indicator spec).
+
+    An indicator spec is a tuple such as ("sma", 20), ("rsi", 60), ("atr", 60) or ("macddiff", 20, 60).
+    Each spec is computed at most once per distinct df_stock while it stays in the cache; the MACD signal
+    and diff of a (fast, slow) pair share a single MACD computation and are cached together as one entry.
+    """
+
+    def __init__(self, maxsize = 1024):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(df_stock):
+        """ Content hash of the index and the OHLC columns the indicators read. """
+        digest = hashlib.sha1(np.asarray(df_stock.index.asi8 if isinstance(df_stock.index, pd.DatetimeIndex) else df_stock.index).tobytes())
+        for column in ["high", "low", "close"]:
+            digest.update(np.ascontiguousarray(df_stock.loc[:, column].to_numpy(dtype = float)).tobytes())
+        return digest.hexdigest()
+
+    def get(self, df_stock, spec, fingerprint = None):
+        """ Series for `spec` on `df_stock`, computed on a miss.
+
+        Args:
+            df_stock (pd.DataFrame): 1-minute bars with high, low and close columns.
+            spec (tuple): Indicator name followed by its window(s).
+            fingerprint (str): Precomputed `fingerprint(df_stock)`, to hash the frame once per batch.
+        """
+        if fingerprint is None:
+            fingerprint = self.fingerprint(df_stock)
+        match spec:
+            case ("macdsignal" | "macddiff", fast, slow):
+                key = (fingerprint, ("macd", fast, slow)) # (signal, diff) pair
+            case _:
+                key = (fingerprint, spec)
+        if key in self._cache:
+            self.hits += 1
+            instrumentation.count("indicator_cache.hits")
+            self._cache.move_to_end(key)
+            value = self._cache[key]
+        else:
+            self.misses += 1
+            instrumentation.count("indicator_cache.misses")
+            match spec:
+                case ("sma", window):
+                    value = ta.trend.SMAIndicator(df_stock['close'], window=window).sma_indicator()
+                case ("rsi", window):
+                    value = ta.momentum.RSIIndicator(df_stock['close'], window=window).rsi()
+                case ("atr", window):
+                    value = self.average_true_range(df_stock['high'], df_stock['low'], df_stock['close'], window)
+                case ("macdsignal" | "macddiff", fast, slow):
+                    macd = ta.trend.MACD(df_stock['close'], window_fast=fast, window_slow=slow)
+                    value = (macd.macd_signal(), macd.macd_diff())
+                case _:
+                    raise ValueError(f"Unknown indicator spec: {spec}")
+            self._put(key, value)
+        if spec[0] in ("macdsignal", "macddiff"):
+            return value[0] if spec[0] == "macdsignal" else value[1]
+        return value
+
+    def _put(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last = False)
+
+    @staticmethod
+    def average_true_range(high, low, close, window):
+        """ Same values as `ta.volatility.AverageTrueRange(...).average_true_range()`, looping over arrays instead of Series. """
+        close_shift = close.shift(1)
+        true_range = pd.DataFrame({
+            "tr1": high - low,
+            "tr2": (high - close_shift).abs(),
+            "tr3": (low - close_shift).abs(),
+        }).max(axis = 1)
+        atr = np.zeros(len(close))
+        if len(atr) >= window:
+            atr[window - 1] = true_range.iloc[0:window].mean()
+            tr = true_range.to_numpy(dtype = float)
+            for i in range(window, len(atr)):
+                atr[i] = (atr[i - 1] * (window - 1) + tr[i]) / float(window)
+        return pd.Series(atr, index = close.index, name = "atr")
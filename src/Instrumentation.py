@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import threading
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime
+
+class Instrumentation:
+    """ Optional per-stage timers and counters for ingestion and backtests.
+
+    The modules share the `instrumentation` instance at the bottom of this file. While it is disabled,
+    `timer` returns a shared no-op context manager and `count` returns immediately, so the hooks left in
+    the hot paths cost one attribute check. Hot loops keep their own tallies and report them once per
+    day rather than once per step.
+
+        from src.Instrumentation import instrumentation
+        instrumentation.enable()
+        ...  # fetch, backtest, walk-forward
+        instrumentation.save("runs/instrumentation.json")
+
+    Timers record calls, total and max seconds; counters are summed. Collection is thread-safe, and
+    `WalkForward` merges what its worker processes collect into the parent's instance.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.timers = dict()
+            self.counters = dict()
+            self.started = datetime.now()
+
+    def timer(self, name):
+        """ Context manager adding the wall time of its block to timer `name`. """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            stats = self.timers.setdefault(name, {"calls": 0, "seconds": 0., "max_seconds": 0.})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def count(self, name, value = 1):
+        """ Add `value` to counter `name`. """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        """ Collected timers and counters as a JSON-serialisable dict. """
+        with self._lock:
+            return {
+                "started": self.started.isoformat(timespec = "seconds"),
+                "timers": {name: dict(stats) for name, stats in sorted(self.timers.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def merge(self, report):
+        """ Add the timers and counters of a `report` from another process. """
+        with self._lock:
+            for name, stats in report["timers"].items():
+                merged = self.timers.setdefault(name, {"calls": 0, "seconds": 0., "max_seconds": 0.})
+                merged["calls"] += stats["calls"]
+                merged["seconds"] += stats["seconds"]
+                merged["max_seconds"] = max(merged["max_seconds"], stats["max_seconds"])
+            for name, value in report["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def save(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent = 2)
+
+    @contextmanager
+    def profile(self, path, profiler = "cProfile"):
+        """ Capture a profile of the block, e.g. one walk-forward run.
+
+        Args:
+            path (str): Output file; pstats data for "cProfile" (open with `pstats` or snakeviz), an HTML
+                report for "pyinstrument".
+            profiler (str): "cProfile" or "pyinstrument" (installed separately).
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+        match profiler:
+            case "cProfile":
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    yield profile
+                finally:
+                    profile.disable()
+                    profile.dump_stats(path)
+            case "pyinstrument":
+                from pyinstrument import Profiler
+                profile = Profiler()
+                profile.start()
+                try:
+                    yield profile
+                finally:
+                    profile.stop()
+                    with open(path, "w") as f:
+                        f.write(profile.output_html())
+            case _:
+                raise ValueError(f"Unknown profiler: {profiler}")
+
+
+class _Timer:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.instrumentation.add_time(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+instrumentation = Instrumentation()
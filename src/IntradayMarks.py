@@ -0,0 +1,79 @@
+from datetime import time
+
+import numpy as np
+import pandas as pd
+
+from src.BlackScholes import BlackScholes
+from src.OptionsChain import OptionsChain
+
+class IntradayMarks:
+    """ Minute-by-minute quotes of every strike between the stored options snapshots.
+
+    Every quote of the latest snapshot is repriced at each minute with Black-Scholes, using that
+    snapshot's `callMidIv`/`putMidIv`. The spot is moved with the 1-minute stock bars and the time to
+    expiry shrinks. The offset between a snapshot's quotes and the model (spread, skew, rates) is held
+    until the next snapshot:
+
+        mark(minute, k) = quote(snapshot, k) + model(minute, k) - model(snapshot, k)
+
+    Marks therefore equal the stored quotes at snapshot times, and they only use data known at the
+    minute: the latest snapshot at or before it, and bars closed before it. Strikes without a usable IV
+    keep the snapshot quote; strikes missing from the snapshot stay NaN.
+
+    `chain` holds the marks as an `OptionsChain` on the minute grid, with the same strikes as the
+    snapshots, so DayTrade can price held legs on it with the snapshot column indices.
+    """
+    IV_COLUMNS = {"callBidPrice": "callMidIv", "callAskPrice": "callMidIv", "putBidPrice": "putMidIv", "putAskPrice": "putMidIv"}
+
+    def __init__(self, df_stock, df_options, expiry = time(16, 0)):
+        """
+        Args:
+            df_stock (pd.DataFrame): 1-minute bars of the day, as from `DataUpdateModule.read_data`.
+            df_options (pd.DataFrame): Options of the day, with the quote and mid IV columns.
+            expiry (datetime.time): Expiry time of the 0DTE contracts, in the options' timezone.
+        """
+        snapshots = OptionsChain(df_options, columns = list(self.IV_COLUMNS) + sorted(set(self.IV_COLUMNS.values())))
+        self.snapshots = snapshots
+
+        # Minute grid from the first to the last snapshot, and the latest snapshot at or before each minute
+        times = pd.date_range(snapshots.times[0], snapshots.times[-1], freq = "1min").union(snapshots.times)
+        snapshot_of = snapshots.times.searchsorted(times, side = "right") - 1
+        snapshot_minute = times.get_indexer(snapshots.times)[snapshot_of]
+
+        # Spot: the snapshot's stockPrice moved by the bars closed since
+        bar_times = df_stock.index
+        closes = df_stock.loc[:, "close"].to_numpy(dtype = float)
+        bar_pos = bar_times.searchsorted(times, side = "left") - 1
+        known_close = np.where(bar_pos >= 0, closes[np.maximum(bar_pos, 0)], np.nan)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            move = known_close / known_close[snapshot_minute]
+        spot = snapshots.spot[snapshot_of] * np.where(np.isfinite(move), move, 1.)
+
+        expiry_time = pd.Timestamp.combine(snapshots.times[0].date(), expiry).tz_localize(snapshots.times.tz)
+        years = np.maximum((expiry_time - times).total_seconds().to_numpy() / (365 * 86400), 1e-6)
+
+        self.quotes = dict()
+        model = dict()
+        for iv_column in sorted(set(self.IV_COLUMNS.values())):
+            iv = snapshots.quotes[iv_column][snapshot_of]
+            call, put = BlackScholes.prices(spot[:, None], snapshots.strikes[None, :], years[:, None], iv)
+            model[iv_column] = call if iv_column == "callMidIv" else put
+        for column, iv_column in self.IV_COLUMNS.items():
+            usable = np.isfinite(model[iv_column]) & (snapshots.quotes[iv_column][snapshot_of] > 0)
+            change = np.where(usable, model[iv_column] - model[iv_column][snapshot_minute], 0.)
+            self.quotes[column] = np.maximum(snapshots.quotes[column][snapshot_of] + change, 0.)
+
+        self.times = times
+        self.spot = spot
+        self.snapshot_of = snapshot_of
+        self.chain = OptionsChain.from_arrays({
+            "times": times.as_unit("ns").asi8,
+            "strikes": snapshots.strikes,
+            "available": snapshots.available[snapshot_of],
+            "rows": np.full((len(times), len(snapshots.strikes)), -1, dtype = np.int64),
+            "spot": spot,
+        } | {f"quote:{column}": values for column, values in self.quotes.items()}, snapshots.times.tz)
+
+    def minutes_between(self, start_time, end_time):
+        """ Positions in `chain` of the minutes strictly between two snapshot times. """
+        return np.arange(self.times.searchsorted(start_time, side = "right"), self.times.searchsorted(end_time, side = "left"))
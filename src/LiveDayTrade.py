@@ -0,0 +1,159 @@
+import heapq
+import time as systime
+from datetime import time
+
+from dateutil.relativedelta import relativedelta
+
+from src.DayTrade import DayTrade
+from src.OptionsChain import OptionsChain
+from src.StreamingIndicators import StreamingIndicators
+
+class LiveDayTrade(DayTrade):
+    """ Event-driven DayTrade for paper trading a model intraday.
+
+    Feed it 1-minute bars with `on_bar` and options snapshots with `on_chain_snapshot`, in time order (a
+    snapshot before the bar of the same minute), then call `on_close` at the end of the day. Indicators are
+    updated incrementally (`StreamingIndicators`) and positions go through the same `DayTrade._step` state
+    machine as the batch numpy engine, so replaying a historical day gives the same trades as `trade()`.
+
+    A snapshot is traded, as in the batch engines, only if its minute also has a full indicator row, so
+    its decision is emitted when the bar of that minute arrives: at most one bar after the snapshot.
+    """
+    EVENT_ORDER = {"snapshot": 0, "bar": 1}
+
+    def __init__(self, strategy, model_num, AUM, commission_dollars = 0.15, max_risk = 0.025, interval = 5, indicators = None):
+        """
+        Args:
+            indicators (StreamingIndicators): Optional indicator state shared by several models fed the
+                same bars; a private one is built from `strategy.indicator_plan()` otherwise.
+        """
+        self.params = strategy.get_models(model_num)
+        self.model_num = model_num
+        self.strategy = strategy
+        self.interval = interval
+        self.commission_dollars = commission_dollars
+        self.max_risk = max_risk
+        self.AUM = AUM
+        self.indicators = indicators if indicators is not None else StreamingIndicators(strategy.indicator_plan())
+
+        self.position = 0
+        self.trades = list()
+        self.strike_lookups = 0
+        self.signals = None # (enter_long, exit_long, enter_short, exit_short) of the latest full indicator row
+        self.last_exit_time = {1: None, -1: None} # latest bar with an exit signal, per direction
+        self.window_start = None # exit signals count from one interval before the first traded snapshot
+        self.pending_snapshot = None
+
+    def on_chain_snapshot(self, snapshot_time, df_snapshot):
+        """ Queue an options snapshot until the bar of its minute confirms it is tradeable.
+
+        Args:
+            snapshot_time (pd.Timestamp): Snapshot time.
+            df_snapshot (pd.DataFrame): Rows of `df_options` for that snapshot.
+
+        Returns:
+            list: Decisions emitted (always empty; decisions come with the bar).
+        """
+        self.pending_snapshot = (snapshot_time, OptionsChain(df_snapshot))
+        return list()
+
+    def on_bar(self, bar_time, bar):
+        """ Update indicators with a 1-minute bar and trade the pending snapshot of the same minute.
+
+        Args:
+            bar_time (pd.Timestamp): Bar timestamp.
+            bar (dict-like): Bar with high, low and close.
+
+        Returns:
+            list: Decisions emitted, each a dict with "action" ("open" or "close") and the trade fields.
+        """
+        self.indicators.update(bar_time, bar)
+        decisions = list()
+        if self.pending_snapshot is not None and bar_time >= self.pending_snapshot[0]:
+            snapshot_time, chain = self.pending_snapshot
+            self.pending_snapshot = None
+            if bar_time == snapshot_time and self.indicators.ready:
+                decisions += self._on_tradeable_snapshot(snapshot_time, chain)
+
+        # Signals of this bar only apply to later snapshots
+        if self.indicators.ready:
+            signal_key = ("signals",) + tuple(self.params[x] for x in self.strategy.SIGNAL_PARAMS)
+            if signal_key not in self.indicators.bar_cache:
+                signals = self.strategy.entry_exit_signals(params = self.params, tech_indicators = self.indicators.frame)
+                self.indicators.bar_cache[signal_key] = tuple(bool(x.iloc[0]) for x in signals)
+            self.signals = self.indicators.bar_cache[signal_key]
+            if self.signals[1]:
+                self.last_exit_time[1] = bar_time
+            if self.signals[3]:
+                self.last_exit_time[-1] = bar_time
+        return decisions
+
+    def on_close(self):
+        """ End of the day: close any open position at the last traded snapshot quoting both legs.
+
+        Returns:
+            list: Decisions emitted.
+        """
+        self.pending_snapshot = None
+        if self._close_position() is None:
+            return list()
+        return [self._decision("close")]
+
+    def _on_tradeable_snapshot(self, snapshot_time, chain):
+        if self.window_start is None:
+            self.window_start = snapshot_time - relativedelta(minutes = self.interval)
+        has_signal = self.signals is not None
+        enter_long, _, enter_short, _ = self.signals if has_signal else (False,) * 4
+        action = self._step(chain, 0,
+            can_enter = has_signal and snapshot_time.time() < time(14, 30),
+            enter_long = enter_long,
+            enter_short = enter_short,
+            exit_long = self.last_exit_time[1] is not None and self.last_exit_time[1] >= self.window_start,
+            exit_short = self.last_exit_time[-1] is not None and self.last_exit_time[-1] >= self.window_start,
+            max_risk_dollars = self.AUM * self.max_risk)
+        return list() if action is None else [self._decision(action)]
+
+    def _decision(self, action):
+        return {"action": action, "model_num": self.model_num} | {key: value for key, value in self.trades[-1].items() if key not in ("leg1_k", "leg2_k")}
+
+    # Feeds
+    def run(self, events):
+        """ Consume a feed of ("bar" | "snapshot", time, payload) events and close the day.
+
+        Returns:
+            pd.DataFrame: Trades with the columns in `DayTrade.TRADE_COLUMNS`, as `DayTrade.trade()` returns.
+        """
+        for kind, event_time, payload in events:
+            match kind:
+                case "bar":
+                    self.on_bar(event_time, payload)
+                case "snapshot":
+                    self.on_chain_snapshot(event_time, payload)
+                case _:
+                    raise ValueError(f"Unknown event: {kind}")
+        self.on_close()
+        return self._trades_frame()
+
+    @classmethod
+    def replay_events(cls, df_stock, df_options, speed = None):
+        """ Events of a stored day (`DataUpdateModule.read_data`) in feed order.
+
+        Args:
+            speed (float): If given, sleep between events to mimic a live feed running `speed` times faster
+                than real time; None replays as fast as possible.
+
+        Yields:
+            tuple: ("bar", time, bar dict) and ("snapshot", time, snapshot rows).
+        """
+        bars = ((x, cls.EVENT_ORDER["bar"], "bar", bar) for x, bar in zip(df_stock.index, df_stock.to_dict("records")))
+        snapshots = ((x, cls.EVENT_ORDER["snapshot"], "snapshot", df) for x, df in df_options.groupby("time", sort = True))
+        previous_time = None
+        for event_time, _, kind, payload in heapq.merge(bars, snapshots, key = lambda x: x[:2]):
+            if speed is not None and previous_time is not None:
+                systime.sleep(max((event_time - previous_time).total_seconds(), 0) / speed)
+            previous_time = event_time
+            yield kind, event_time, payload
+
+    def replay(self, df_stock, df_options, speed = None):
+        """ Trade a stored day through the event-driven path. """
+        return self.run(self.replay_events(df_stock, df_options, speed = speed))
@@ -0,0 +1,137 @@
+import sqlite3
+from datetime import datetime, timezone
+
+class Manifest:
+    """ SQLite index of the data fetched into the data directory.
+
+    Records every fetched options snapshot (ticker, trade minute) with its status ("ok", or "missing" when
+    ORATS has no data for that minute), the stock-bar range fetched for each day, and the snapshots a day is
+    expected to have. Backfills use it to fetch only what is missing, and backtests use it to list
+    complete days without scanning the data directory.
+    """
+    MINUTE_FORMAT = "%Y%m%d%H%M"
+    DATE_FORMAT = "%Y%m%d"
+
+    def __init__(self, path = "data/manifest.sqlite"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    ticker TEXT NOT NULL,
+                    trade_minute TEXT NOT NULL,
+                    trade_date TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    rows INTEGER NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    PRIMARY KEY (ticker, trade_minute)
+                );
+                CREATE TABLE IF NOT EXISTS stock_ranges (
+                    ticker TEXT NOT NULL,
+                    trade_date TEXT NOT NULL,
+                    from_minute TEXT NOT NULL,
+                    to_minute TEXT NOT NULL,
+                    rows INTEGER NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    PRIMARY KEY (ticker, trade_date)
+                );
+                CREATE TABLE IF NOT EXISTS days (
+                    ticker TEXT NOT NULL,
+                    trade_date TEXT NOT NULL,
+                    expected_snapshots INTEGER NOT NULL,
+                    PRIMARY KEY (ticker, trade_date)
+                );
+            """)
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat(timespec = "seconds")
+
+    # Recording
+    def expect_day(self, trade_date, trade_minutes, ticker = "SPY"):
+        """ Register the snapshots a day should have, so completeness can be checked later. """
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO days VALUES (?, ?, ?)",
+                (ticker, trade_date.strftime(self.DATE_FORMAT), len(trade_minutes)))
+
+    def record_snapshot(self, trade_minute, rows, ticker = "SPY"):
+        """ Record a fetched snapshot; `rows` is None when ORATS had no data for the minute. """
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                (ticker, trade_minute.strftime(self.MINUTE_FORMAT), trade_minute.strftime(self.DATE_FORMAT),
+                 "missing" if rows is None else "ok", int(rows or 0), self._now()))
+
+    def record_stock_range(self, trade_date, from_minute, to_minute, rows, ticker = "SPY"):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO stock_ranges VALUES (?, ?, ?, ?, ?, ?)",
+                (ticker, trade_date.strftime(self.DATE_FORMAT), from_minute.strftime(self.MINUTE_FORMAT),
+                 to_minute.strftime(self.MINUTE_FORMAT), rows, self._now()))
+
+    def forget_day(self, trade_date, ticker = "SPY"):
+        """ Drop everything recorded for a day, e.g. before refetching it from scratch. """
+        trade_date = trade_date.strftime(self.DATE_FORMAT)
+        with self.connection:
+            for table in ["snapshots", "stock_ranges", "days"]:
+                self.connection.execute(f"DELETE FROM {table} WHERE ticker = ? AND trade_date = ?", (ticker, trade_date))
+
+    # Queries
+    def missing_snapshots(self, trade_minutes, ticker = "SPY"):
+        """ The trade minutes of `trade_minutes` that have not been fetched yet. """
+        if len(trade_minutes) == 0:
+            return list()
+        dates = sorted({x.strftime(self.DATE_FORMAT) for x in trade_minutes})
+        fetched = {x[0] for x in self.connection.execute(
+            f"SELECT trade_minute FROM snapshots WHERE ticker = ? AND trade_date IN ({','.join('?' * len(dates))})",
+            (ticker, *dates))}
+        return [x for x in trade_minutes if x.strftime(self.MINUTE_FORMAT) not in fetched]
+
+    def has_stock_range(self, trade_date, ticker = "SPY"):
+        return self.connection.execute(
+            "SELECT 1 FROM stock_ranges WHERE ticker = ? AND trade_date = ?",
+            (ticker, trade_date.strftime(self.DATE_FORMAT))).fetchone() is not None
+
+    def recorded_days(self, ticker = "SPY"):
+        """ Days with a stock range recorded and days with any options snapshot recorded.
+
+        Returns:
+            tuple: (stock_days, options_days), sets of datetime.
+        """
+        return tuple(
+            {datetime.strptime(x[0], self.DATE_FORMAT) for x in self.connection.execute(f"SELECT DISTINCT trade_date FROM {table} WHERE ticker = ?", (ticker,))}
+            for table in ["stock_ranges", "snapshots"])
+
+    def is_complete(self, trade_date, ticker = "SPY"):
+        return trade_date in self.available_days(ticker, start = trade_date, end = trade_date)
+
+    def available_days(self, ticker = "SPY", start = None, end = None):
+        """ Days with stock bars, every expected snapshot fetched and at least one non-empty snapshot.
+
+        Args:
+            start, end (datetime): Optional inclusive bounds on the trading day.
+
+        Returns:
+            list: Sorted trading days (datetime).
+        """
+        query = """
+            SELECT d.trade_date FROM days d
+            JOIN stock_ranges r ON r.ticker = d.ticker AND r.trade_date = d.trade_date
+            JOIN snapshots s ON s.ticker = d.ticker AND s.trade_date = d.trade_date
+            WHERE d.ticker = ? AND d.trade_date >= ? AND d.trade_date <= ?
+            GROUP BY d.trade_date, d.expected_snapshots
+            HAVING COUNT(s.trade_minute) >= d.expected_snapshots AND SUM(s.status = 'ok') > 0
+            ORDER BY d.trade_date
+        """
+        bounds = (
+            "00000000" if start is None else start.strftime(self.DATE_FORMAT),
+            "99999999" if end is None else end.strftime(self.DATE_FORMAT),
+        )
+        return [datetime.strptime(x[0], self.DATE_FORMAT) for x in self.connection.execute(query, (ticker, *bounds))]
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM days").fetchone()[0]
@@ -0,0 +1,125 @@
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+class OptionsChain:
+    """ Dense (snapshot, strike) view of one day of options data.
+
+    The chain is built once from the long-format `df_options` returned by `DataUpdateModule.read_data`
+    and exposes every quote column as a 2D array of shape (len(times), len(strikes)). Cells for strikes
+    that were not quoted in a snapshot are NaN and flagged False in `available`, and `rows` maps every
+    cell back to its row in `df_options`. Exact strikes resolve through a dict and nearest strikes through a
+    binary search, so DayTrade and analysis code never scan the chain.
+    """
+    QUOTE_COLUMNS = ["putBidPrice", "putAskPrice", "callBidPrice", "callAskPrice"]
+
+    def __init__(self, df_options, columns = QUOTE_COLUMNS):
+        snapshot_times = pd.DatetimeIndex(df_options.loc[:, "time"])
+        self.times = snapshot_times.unique().sort_values()
+        self.strikes = np.sort(df_options.loc[:, "strike"].unique()).astype(float)
+
+        # Position of every row in the (snapshot, strike) grid, keeping the first row of duplicates
+        t_idx = self.times.get_indexer(snapshot_times)
+        k_idx = np.searchsorted(self.strikes, df_options.loc[:, "strike"].to_numpy())
+        cells, first_rows = np.unique(t_idx * len(self.strikes) + k_idx, return_index = True)
+
+        self.available = np.zeros((len(self.times), len(self.strikes)), dtype = bool)
+        self.available.flat[cells] = True
+
+        self.quotes = dict()
+        for column in columns:
+            values = np.full((len(self.times), len(self.strikes)), np.nan)
+            values.flat[cells] = df_options.loc[:, column].to_numpy(dtype = float)[first_rows]
+            self.quotes[column] = values
+
+        # Row of df_options behind every cell, -1 where the strike was not quoted
+        self.rows = np.full((len(self.times), len(self.strikes)), -1, dtype = np.int64)
+        self.rows.flat[cells] = first_rows
+
+        # Spot of a snapshot is the stockPrice of its first row
+        _, first_snapshot_rows = np.unique(t_idx, return_index = True)
+        self.spot = df_options.loc[:, "stockPrice"].to_numpy(dtype = float)[first_snapshot_rows]
+        self._build_index()
+
+    def _build_index(self):
+        """ Lookup structures derived from `strikes` and `available`.
+
+        `prev_available[t, k]` / `next_available[t, k]` are the closest quoted columns at or below / at or
+        above column k in snapshot t (-1 / len(strikes) if none), which turns the nearest quoted strike
+        into a binary search over the strike grid.
+        """
+        n_strikes = len(self.strikes)
+        columns = np.arange(n_strikes)
+        self.prev_available = np.maximum.accumulate(np.where(self.available, columns, -1), axis = 1)
+        self.next_available = np.minimum.accumulate(np.where(self.available, columns, n_strikes)[:, ::-1], axis = 1)[:, ::-1]
+        self._strike_list = self.strikes.tolist()
+        self._strike_columns = {x: k for k, x in enumerate(self._strike_list)}
+
+    def __len__(self):
+        return len(self.times)
+
+    def to_arrays(self):
+        """ The chain as plain numpy arrays (times as int64 epoch ns), e.g. to place it in shared memory. """
+        arrays = {"times": self.times.as_unit("ns").asi8, "strikes": self.strikes, "available": self.available, "rows": self.rows, "spot": self.spot}
+        return arrays | {f"quote:{column}": values for column, values in self.quotes.items()}
+
+    @classmethod
+    def from_arrays(cls, arrays, tz):
+        """ Rebuild a chain from `to_arrays` output without copying the arrays.
+
+        Args:
+            arrays (dict): Output of `to_arrays`, possibly views into shared memory.
+            tz (tzinfo): Timezone of the original `time` column.
+        """
+        chain = cls.__new__(cls)
+        chain.times = pd.DatetimeIndex(arrays["times"]).tz_localize("UTC").tz_convert(tz)
+        chain.strikes = arrays["strikes"]
+        chain.available = arrays["available"]
+        chain.rows = arrays["rows"]
+        chain.spot = arrays["spot"]
+        chain.quotes = {key.split(":", 1)[1]: values for key, values in arrays.items() if key.startswith("quote:")}
+        chain._build_index()
+        return chain
+
+    def strike_index(self, strike):
+        """ Column of `strike` in the strike grid, or -1 if the strike was never quoted. """
+        return self._strike_columns.get(float(strike), -1)
+
+    def nearest_strike_index(self, t, strike):
+        """ Column of the quoted strike closest to `strike` in snapshot `t`.
+
+        Binary search on the strike grid, then the closest quoted column on either side. Ties resolve
+        to the lower strike, which is what `DayTrade.find_closest_strike` returns for strike-ordered
+        chains such as the ones ORATS serves.
+        """
+        n_strikes = len(self._strike_list)
+        k = bisect_left(self._strike_list, strike)
+        below = int(self.prev_available[t, k - 1]) if k > 0 else -1
+        above = int(self.next_available[t, k]) if k < n_strikes else n_strikes
+        if above == n_strikes:
+            return max(below, 0)
+        if below < 0 or abs(self._strike_list[above] - strike) < abs(self._strike_list[below] - strike):
+            return above
+        return below
+
+    def nearest_strike_indices(self, t, strikes):
+        """ Vectorised `nearest_strike_index` for an array of target strikes in snapshot `t`. """
+        strikes = np.asarray(strikes, dtype = float)
+        n_strikes = len(self.strikes)
+        k = np.searchsorted(self.strikes, strikes)
+        below = np.where(k > 0, self.prev_available[t, np.maximum(k - 1, 0)], -1)
+        above = np.where(k < n_strikes, self.next_available[t, np.minimum(k, n_strikes - 1)], n_strikes)
+        with np.errstate(invalid = "ignore"):
+            use_above = (above < n_strikes) & ((below < 0) | (np.abs(self.strikes[np.minimum(above, n_strikes - 1)] - strikes) < np.abs(self.strikes[np.maximum(below, 0)] - strikes)))
+        return np.where(use_above, above, np.maximum(below, 0))
+
+    def row(self, t, k):
+        """ Position in the source df_options of cell (t, k), or -1 if the strike was not quoted. """
+        return int(self.rows[t, k]) if k >= 0 else -1
+
+    def quote(self, column, t, k):
+        """ Quote as a Python float; NaN for k == -1, the `strike_index` of a strike missing from the chain. """
+        if k < 0:
+            return np.nan
+        return float(self.quotes[column][t, k])
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+class OptionsDataset:
+    """ Lazy view of the options chains in a `DataStore`, one day or one snapshot at a time.
+
+    Nothing is read until a day is iterated, and only the requested columns and the strikes within
+    `strike_band` dollars of each snapshot's spot are decoded. The band is evaluated inside the Parquet
+    scan, so the rows outside it are never materialised. Files are memory-mapped by default. Iterating
+    `days()` holds one day at a time and `snapshots()` one snapshot at a time, so peak memory does not
+    grow with the number of days covered.
+
+    Chunks have the layout of `DataStore.read_options` (and hence `DataUpdateModule.read_data`).
+    """
+
+    def __init__(self, store, columns = None, strike_band = None, filters = None, memory_map = True, batch_rows = 2 ** 16):
+        """
+        Args:
+            store (DataStore): Store to read from, e.g. `DataUpdateModule.store`.
+            columns (list): Options columns to load; `time` is always included. Defaults to all columns.
+            strike_band (float): Keep only strikes with |strike - stockPrice| <= strike_band. Defaults to all strikes.
+            filters (list): Further row filters, in the format of `DataStore.read_options`.
+            memory_map (bool): Memory-map the Parquet files instead of reading them into buffers.
+            batch_rows (int): Rows decoded at a time by `snapshots`.
+        """
+        self.store = store
+        self.columns = None if columns is None else ["time"] + [x for x in columns if x != "time"]
+        self.strike_band = strike_band
+        self.filters = filters
+        self.filesystem = fs.LocalFileSystem(use_mmap = memory_map)
+        self.batch_rows = batch_rows
+
+    def available_days(self):
+        return self.store.available_days()
+
+    def _dataset(self, trade_date):
+        return ds.dataset(self.store._partition("options", trade_date), format = "parquet", filesystem = self.filesystem)
+
+    def _filter(self):
+        expression = None
+        if self.strike_band is not None:
+            # strike is dictionary-encoded in the files, so compare it as float64
+            strike, spot = pc.field("strike").cast(pa.float64()), pc.field("stockPrice")
+            expression = (strike >= spot - self.strike_band) & (strike <= spot + self.strike_band)
+        if self.filters is not None:
+            filters = pq.filters_to_expression(self.store._normalise_filters(self.filters))
+            expression = filters if expression is None else expression & filters
+        return expression
+
+    def read_day(self, trade_date):
+        """ Options of a day, restricted to the dataset's columns and strike band. """
+        return self.store._options_frame(self._dataset(trade_date).to_table(columns = self.columns, filter = self._filter()))
+
+    def days(self, trade_dates = None):
+        """ Yield (trade_date, df_stock, df_options) for each day, as `DataUpdateModule.read_data` would.
+
+        Args:
+            trade_dates (list): Days to iterate; defaults to `available_days()`.
+        """
+        for trade_date in (self.available_days() if trade_dates is None else trade_dates):
+            yield trade_date, self.store.read_stock(trade_date), self.read_day(trade_date)
+
+    def snapshots(self, trade_date):
+        """ Yield (time, df_snapshot) for each options snapshot of a day, in time order.
+
+        Record batches are streamed from the scan and cut at snapshot boundaries, so only one snapshot
+        (plus one batch) is held in memory. Part files that are not in time order, e.g. left by an
+        interrupted fetch before `DataStore.compact_options`, are sorted in memory instead.
+        """
+        dataset = self._dataset(trade_date)
+        times = dataset.to_table(columns = ["time"], filter = self._filter()).column("time").to_numpy()
+        if np.all(np.diff(times) >= 0):
+            batches = dataset.to_batches(columns = self.columns, filter = self._filter(), batch_size = self.batch_rows)
+        else:
+            batches = dataset.to_table(columns = self.columns, filter = self._filter()).sort_by("time").to_batches(self.batch_rows)
+
+        pending, pending_time = list(), None
+        for batch in batches:
+            time = batch.column("time").to_numpy()
+            if len(time) == 0:
+                continue
+            starts = np.r_[0, np.flatnonzero(np.diff(time)) + 1]
+            for start, stop in zip(starts, np.r_[starts[1:], len(time)]):
+                if pending_time is not None and time[start] != pending_time:
+                    yield self._snapshot(pending, pending_time)
+                    pending = list()
+                pending.append(batch.slice(start, stop - start))
+                pending_time = time[start]
+        if len(pending) > 0:
+            yield self._snapshot(pending, pending_time)
+
+    def _snapshot(self, batches, time):
+        return pd.Timestamp(time, tz = "UTC").tz_convert(self.store.TIMEZONE), self.store._options_frame(pa.Table.from_batches(batches))
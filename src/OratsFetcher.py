@@ -0,0 +1,98 @@
+import time
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.Instrumentation import instrumentation
+
+class TokenBucket:
+    """ Thread-safe token bucket: `rate` tokens per second, holding at most `capacity` tokens. """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """ Block until a token is available, then take it. """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class OratsFetcher:
+    """ Pooled, rate-limited client for the ORATS one-minute strikes chain endpoint.
+
+    One `requests.Session` is shared by all worker threads so connections are kept alive, every request
+    first takes a token from a `TokenBucket` sized to the ORATS quota, and 429/5xx responses or
+    connection errors are retried with exponential backoff (honouring `Retry-After` when sent).
+    """
+    URL = "https://api.orats.io/datav2/historical/one-minute/strikes/chain"
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, token, url = URL, max_workers = 8, requests_per_minute = 1000, max_retries = 5, backoff_seconds = 1., timeout = 60):
+        self.token = token
+        self.url = url
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(rate = requests_per_minute / 60, capacity = max(1, max_workers))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = max_workers, pool_maxsize = max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def fetch(self, trade_minute_est, ticker = "SPY"):
+        """ Raw CSV chain of `ticker` at a trade minute in EST timezone.
+
+        Returns:
+            bytes: Response body, or None if ORATS has no snapshot for that minute (404).
+        """
+        querystring = {"token" : self.token, "ticker" : ticker, "tradeDate" : trade_minute_est.strftime("%Y%m%d%H%M")}
+        for attempt in range(self.max_retries + 1):
+            with instrumentation.timer("orats.rate_limit_wait"):
+                self.rate_limiter.acquire()
+            try:
+                with instrumentation.timer("orats.request"):
+                    response = self.session.get(self.url, params = querystring, timeout = self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                instrumentation.count("orats.retries")
+                time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code == 404:
+                instrumentation.count("orats.not_found")
+                return None
+            if response.status_code in self.RETRY_STATUS and attempt < self.max_retries:
+                instrumentation.count("orats.retries")
+                time.sleep(self._backoff(attempt, response.headers.get("Retry-After")))
+                continue
+            response.raise_for_status()
+            instrumentation.count("orats.snapshots")
+            instrumentation.count("orats.bytes", len(response.content))
+            return response.content
+
+    def _backoff(self, attempt, retry_after = None):
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff_seconds * 2 ** attempt * (1 + random.random())
@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from src.Instrumentation import instrumentation
+from src.WalkForward import _strategy_with_models
+
+class ParamSearch:
+    """ Successive halving over the days of a selection month, on a random sample of the params grid.
+
+    Instead of backtesting every model of `Strategy.params_grid` on every day, `n_candidates` models are
+    drawn at random and run on the first `min_days` days. They are ranked as `WalkForward.rank_models`
+    ranks the full grid, and only the best 1/`eta` of them are run on the following days. The rungs grow
+    by a factor `eta` (min_days, min_days * eta, ...) until the survivors have traded the whole month,
+    and the best of them is the month's model. A model dropped at an early rung is never run on the rest
+    of the month, so the pick can differ from the full grid's, even when the sample is the whole grid.
+
+    The sample is drawn from a generator seeded with `seed` and the first day of the month, so a pick is
+    reproducible and does not depend on which other months are run. Each rung goes through
+    `WalkForward.gross_trades`, so the candidates are replayed in parallel and share its result cache.
+
+        search = ParamSearch(n_candidates = 81, eta = 3, seed = 0)
+        walk_forward = WalkForward(Strategy(params_grid), data_module, search = search, max_workers = 8)
+    """
+
+    def __init__(self, n_candidates = 81, eta = 3, min_days = 2, seed = 0):
+        """
+        Args:
+            n_candidates (int): Models sampled from the grid each month; the whole grid if it is smaller.
+            eta (int): Keep the best 1/eta of the candidates at each rung, which then run eta times as many days.
+            min_days (int): Days of the first rung. At least 2, as a ranking needs a standard deviation.
+            seed (int): Seed of the sampling.
+        """
+        if min_days < 2:
+            raise ValueError(f"min_days must be at least 2, got {min_days}")
+        if eta < 2:
+            raise ValueError(f"eta must be at least 2, got {eta}")
+        self.n_candidates = n_candidates
+        self.eta = eta
+        self.min_days = min_days
+        self.seed = seed
+
+    def budgets(self, n_days):
+        """ Number of days run by the candidates of each rung; the last rung covers all `n_days`. """
+        budgets = list()
+        budget = self.min_days
+        while budget < n_days:
+            budgets.append(budget)
+            budget *= self.eta
+        return budgets + [n_days]
+
+    def sample(self, n_models, rng):
+        """ Sorted model numbers of the candidates, out of `n_models`. """
+        if n_models <= self.n_candidates:
+            return np.arange(n_models)
+        return np.sort(rng.choice(n_models, size = self.n_candidates, replace = False))
+
+    def select(self, walk_forward, trade_days, aum):
+        """ Pick the best model over `trade_days`.
+
+        Args:
+            walk_forward (WalkForward): Supplies the strategy, the gross trades and the sizing.
+            trade_days (list): Days of the selection month, in order.
+            aum (float): Starting AUM of every candidate; each then compounds its own PnL, as in the full grid.
+
+        Returns:
+            dict: "best_model" (number in `strategy.get_models()`), "params", "rankings" (ratios of the
+                last rung), "training" (daily PnL of every candidate on the days it ran, with the layout of
+                `WalkForward.run`'s training frames) and "rungs" (list of (days, model numbers) run).
+        """
+        models = walk_forward.strategy.get_models()
+        rng = np.random.default_rng([self.seed, trade_days[0].toordinal()])
+        survivors = self.sample(len(models), rng)
+        models_aum = dict.fromkeys(survivors.tolist(), aum)
+        training = list()
+        rungs = list()
+        days_run = 0
+        for budget in self.budgets(len(trade_days)):
+            new_days = trade_days[days_run:budget]
+            strategy = _strategy_with_models(walk_forward.strategy, [models[x] for x in survivors])
+            gross_by_day = walk_forward.gross_trades(new_days, strategy = strategy)
+            for trade_day in new_days:
+                _, pnls = walk_forward._model_day_pnl(gross_by_day[trade_day], [models_aum[x] for x in survivors])
+                for model_num, pnl in zip(survivors, pnls):
+                    models_aum[model_num] += pnl
+                training.append(pd.DataFrame([models[x] | {"pnl" : pnl, "model_num" : x} for x, pnl in zip(survivors, pnls)]).assign(day = trade_day))
+            instrumentation.count("search.model_days", len(survivors) * len(new_days))
+            rungs.append((budget, survivors.tolist()))
+            days_run = budget
+
+            evaluated = pd.concat(training)
+            rankings = walk_forward.rank_models(evaluated[evaluated.loc[:, "model_num"].isin(survivors)])
+            if budget == len(trade_days):
+                break
+            keep = math.ceil(len(survivors) / self.eta)
+            instrumentation.count("search.pruned", len(survivors) - keep)
+            survivors = np.sort(rankings.index[:keep].to_numpy(dtype = int))
+            if len(survivors) == 1:
+                break
+
+        best_model = int(rankings.index[0])
+        return {"best_model": best_model, "params": models[best_model], "rankings": rankings, "training": pd.concat(training), "rungs": rungs}
@@ -0,0 +1,125 @@
+import os
+import json
+import uuid
+import hashlib
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.DataStore import DataStore
+from src.DayTrade import DayTrade
+from src.IndicatorCache import IndicatorCache
+
+class ResultCache:
+    """ Persistent cache of the per-model gross trades of backtested days.
+
+    Entries are keyed by (trade date, data fingerprint, `DayTrade.ENGINE_VERSION`, interval, model params), and
+    hold the output of `DayTrade.trade_all_gross` for that model, i.e. the trades before sizing. Sizing
+    and PnL for any AUM, commission or max_risk are re-derived with `DayTrade.size_trades`, so only new
+    days, new models, changed data or a new engine version need a replay.
+
+    Layout:
+        {root}/index.sqlite                             which (day, fingerprint, engine, interval, params) are cached
+        {root}/date=YYYYMMDD/{part}.parquet             gross trades of a batch of models, with a `params` column
+    """
+
+    def __init__(self, root = "data/result_cache"):
+        self.root = root
+        os.makedirs(root, exist_ok = True)
+        self.connection = sqlite3.connect(os.path.join(root, "index.sqlite"))
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS computed (
+                    trade_date TEXT NOT NULL,
+                    data_fingerprint TEXT NOT NULL,
+                    engine_version INTEGER NOT NULL,
+                    interval INTEGER NOT NULL,
+                    params TEXT NOT NULL,
+                    part TEXT NOT NULL,
+                    PRIMARY KEY (trade_date, data_fingerprint, engine_version, interval, params)
+                )
+            """)
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def params_key(params):
+        return json.dumps(params, sort_keys = True)
+
+    @staticmethod
+    def fingerprint(df_stock, df_options):
+        """ Content hash of a day's stock bars and options chain. """
+        digest = hashlib.sha1(IndicatorCache.fingerprint(df_stock).encode())
+        digest.update(",".join(df_options.columns).encode())
+        digest.update(pd.util.hash_pandas_object(df_options, index = False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def _partition(self, trade_date):
+        return os.path.join(self.root, f"date={trade_date.strftime('%Y%m%d')}")
+
+    def _key(self, trade_date, fingerprint, interval):
+        return (trade_date.strftime("%Y%m%d"), fingerprint, DayTrade.ENGINE_VERSION, interval)
+
+    def load(self, trade_date, fingerprint, models, interval = 5, tz = None):
+        """ Cached gross trades of `models` on a day.
+
+        Args:
+            fingerprint (str): `fingerprint(df_stock, df_options)` of the day.
+            models (list): Model params, e.g. `strategy.get_models()`.
+            tz (tzinfo): Timezone of the day's options `time` column; entry and exit times are returned in it.
+
+        Returns:
+            tuple: (gross_trades, missing). `gross_trades` has the layout of `DayTrade.trade_all_gross` with
+                `model_num` indexing `models`; `missing` lists the model numbers that are not cached.
+        """
+        parts = dict(self.connection.execute(
+            "SELECT params, part FROM computed WHERE trade_date = ? AND data_fingerprint = ? AND engine_version = ? AND interval = ?",
+            self._key(trade_date, fingerprint, interval)).fetchall())
+        keys = [self.params_key(x) for x in models]
+        model_nums = dict()
+        for model_num, key in enumerate(keys):
+            model_nums.setdefault(key, model_num)
+        missing = [model_num for model_num, key in enumerate(keys) if key not in parts]
+
+        frames = list()
+        for part in sorted({parts[x] for x in keys if x in parts} - {""}):
+            df = pd.read_parquet(os.path.join(self._partition(trade_date), f"{part}.parquet"))
+            df = df[df.loc[:, "params"].isin(model_nums.keys())]
+            frames.append(df.assign(model_num = df.loc[:, "params"].map(model_nums).astype(int)).drop(columns = "params"))
+        frames = [x for x in frames if len(x) > 0]
+        if len(frames) == 0:
+            return pd.DataFrame(columns = DayTrade.GROSS_TRADE_COLUMNS), missing
+        gross_trades = pd.concat(frames).loc[:, DayTrade.GROSS_TRADE_COLUMNS]
+        if tz is not None:
+            for column in ["entry_time", "exit_time"]:
+                gross_trades[column] = gross_trades.loc[:, column].dt.tz_convert(tz)
+        return self.sort(gross_trades), missing
+
+    def store(self, trade_date, fingerprint, models, gross_trades, interval = 5):
+        """ Cache the gross trades of `models` on a day; models without trades are recorded as such.
+
+        Args:
+            models (list): Model params; `gross_trades["model_num"]` indexes this list.
+            gross_trades (pd.DataFrame): Output of `DayTrade.trade_all_gross` for `models`.
+        """
+        keys = np.array([self.params_key(x) for x in models], dtype = object)
+        df = gross_trades.assign(params = keys[gross_trades.loc[:, "model_num"].to_numpy(dtype = int)]).drop(columns = "model_num")
+        part = f"part-{uuid.uuid4().hex}" if len(df) > 0 else "" # no file when none of the models traded
+        if len(df) > 0:
+            DataStore._write(pa.Table.from_pandas(df, preserve_index = False), self._partition(trade_date), part)
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO computed VALUES (?, ?, ?, ?, ?, ?)",
+                [self._key(trade_date, fingerprint, interval) + (x, part) for x in dict.fromkeys(keys)])
+
+    @staticmethod
+    def sort(gross_trades):
+        """ Order trades by model then entry time, as `DayTrade.trade_all_gross` does. """
+        order = np.lexsort([pd.DatetimeIndex(gross_trades.loc[:, "entry_time"]).asi8, gross_trades.loc[:, "model_num"].to_numpy(dtype = int)])
+        return gross_trades.iloc[order].reset_index(drop = True)
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM computed").fetchone()[0]
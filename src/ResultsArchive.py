@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.DataStore import DataStore
+from src.DayTrade import DayTrade
+
+class ResultsArchive:
+    """ Columnar archive of walk-forward results, with running analytics updated one month at a time.
+
+    Each appended month is written once as Parquet and reduced in a single vectorised pass to per-month
+    aggregates, which are upserted into SQLite:
+    - daily PnL, equity, running peak and drawdown
+    - trade count, wins and PnL
+    - the same by exit reason
+    - per-parameter attribution of the training PnL (and of the traded PnL when the month's params are given)
+
+    Reports are then read from these small tables rather than from the trades. Appending the next month
+    only adds its rows and carries equity and peak forward from the previous day. Replacing or inserting
+    an earlier month recomputes the equity of the days after it from the stored daily PnL.
+
+    Layout:
+        {root}/index.sqlite                             archived months, initial AUM and the aggregates
+        {root}/trades/month=YYYY-MM/part-0.parquet      `DayTrade.trade()` records of the month, with a `day` column
+        {root}/training/month=YYYY-MM/part-0.parquet    per-model daily PnL of the month, as in `past_mth_test_YYYY-MM.csv`
+    """
+    TRAINING_COLUMNS = ["pnl", "model_num", "day"]
+
+    def __init__(self, root = "results/archive", initial_aum = 6.5 * 1e6):
+        """
+        Args:
+            root (str): Archive directory, created if missing.
+            initial_aum (float): AUM before the first archived day. Fixed when the archive is created.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok = True)
+        self.connection = sqlite3.connect(os.path.join(root, "index.sqlite"))
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS months (kind TEXT NOT NULL, month TEXT NOT NULL, rows INTEGER NOT NULL, PRIMARY KEY (kind, month));
+                CREATE TABLE IF NOT EXISTS daily (
+                    day TEXT PRIMARY KEY, month TEXT NOT NULL, trades INTEGER NOT NULL, pnl REAL NOT NULL,
+                    equity REAL NOT NULL, peak REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS exit_reasons (
+                    month TEXT NOT NULL, exit_reason TEXT NOT NULL, trades INTEGER NOT NULL, wins INTEGER NOT NULL,
+                    pnl REAL NOT NULL, gross_profit REAL NOT NULL, gross_loss REAL NOT NULL,
+                    PRIMARY KEY (month, exit_reason)
+                );
+                CREATE TABLE IF NOT EXISTS attribution (
+                    source TEXT NOT NULL, month TEXT NOT NULL, param TEXT NOT NULL, value TEXT NOT NULL,
+                    count INTEGER NOT NULL, wins INTEGER NOT NULL, pnl REAL NOT NULL, pnl_sq REAL NOT NULL,
+                    PRIMARY KEY (source, month, param, value)
+                );
+            """)
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('initial_aum', ?)", (repr(float(initial_aum)),))
+        self.initial_aum = float(self.connection.execute("SELECT value FROM meta WHERE key = 'initial_aum'").fetchone()[0])
+        if self.initial_aum != float(initial_aum):
+            raise ValueError(f"Archive {root} was created with initial_aum = {self.initial_aum}, got {initial_aum}")
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _month_key(month):
+        return month if isinstance(month, str) else month.strftime("%Y-%m")
+
+    @staticmethod
+    def _value_key(value):
+        return json.dumps(value.item() if isinstance(value, np.generic) else value)
+
+    def _partition(self, kind, month):
+        return os.path.join(self.root, kind, f"month={self._month_key(month)}")
+
+    def months(self, kind = "trades"):
+        """ Archived months of `kind` ("trades" or "training"), as 'YYYY-MM' strings. """
+        return [x for x, in self.connection.execute("SELECT month FROM months WHERE kind = ? ORDER BY month", (kind,))]
+
+    # Appending
+    def append_trades(self, month, trades, days = None, params = None):
+        """ Archive the actual trades of a month, replacing any already archived for it.
+
+        Args:
+            month (datetime or str): Month traded.
+            trades (pd.DataFrame): Trade records with the columns in `DayTrade.TRADE_COLUMNS`, e.g. the
+                concatenated `DayTrade.trade()` output of the month's days.
+            days (list): Trading days of the month, so days without trades enter the equity curve with zero
+                PnL. Defaults to the entry days of `trades`.
+            params (dict): Params of the model traded in the month, for `attribution("trades")`.
+        """
+        month = self._month_key(month)
+        trades = trades.loc[:, DayTrade.TRADE_COLUMNS].reset_index(drop = True)
+        entry_time = pd.to_datetime(trades.loc[:, "entry_time"], utc = True).dt.tz_convert(DataStore.TIMEZONE)
+        trades = trades.assign(
+            entry_time = entry_time,
+            exit_time = pd.to_datetime(trades.loc[:, "exit_time"], utc = True).dt.tz_convert(DataStore.TIMEZONE),
+            day = entry_time.dt.tz_localize(None).dt.normalize(),
+        ).astype({"direction": int, "contracts": int, "exit_reason": str})
+        days = pd.DatetimeIndex(sorted(set(trades.loc[:, "day"])) if days is None else days).normalize()
+
+        pnl = trades.loc[:, "pnl"].to_numpy(dtype = float)
+        win = pnl > 0
+        daily = trades.groupby("day").agg(trades = ("pnl", "size"), pnl = ("pnl", "sum"))
+        daily = daily.reindex(days.union(daily.index), fill_value = 0)
+        by_reason = trades.assign(wins = win, gross_profit = np.where(win, pnl, 0.), gross_loss = np.where(win, 0., pnl)).groupby("exit_reason").agg(
+            trades = ("pnl", "size"), wins = ("wins", "sum"), pnl = ("pnl", "sum"), gross_profit = ("gross_profit", "sum"), gross_loss = ("gross_loss", "sum"))
+
+        self._write(trades, "trades", month)
+        with self.connection:
+            self.connection.execute("DELETE FROM daily WHERE month = ?", (month,))
+            self.connection.execute("DELETE FROM exit_reasons WHERE month = ?", (month,))
+            self.connection.execute("DELETE FROM attribution WHERE source = 'trades' AND month = ?", (month,))
+            self.connection.executemany("INSERT INTO daily VALUES (?, ?, ?, ?, 0, 0)",
+                [(day.strftime("%Y-%m-%d"), month, int(row.trades), float(row.pnl)) for day, row in daily.iterrows()])
+            self.connection.executemany("INSERT INTO exit_reasons VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(month, reason, int(row.trades), int(row.wins), float(row.pnl), float(row.gross_profit), float(row.gross_loss)) for reason, row in by_reason.iterrows()])
+            if params is not None and len(trades) > 0:
+                self.connection.executemany("INSERT INTO attribution VALUES ('trades', ?, ?, ?, ?, ?, ?, ?)",
+                    [(month, param, self._value_key(value), len(pnl), int(win.sum()), float(pnl.sum()), float((pnl ** 2).sum())) for param, value in params.items()])
+            self._update_equity(f"{month}-01")
+            self.connection.execute("INSERT OR REPLACE INTO months VALUES ('trades', ?, ?)", (month, len(trades)))
+
+    def append_training(self, month, training):
+        """ Archive the per-model daily PnL of a month, replacing any already archived for it.
+
+        Args:
+            month (datetime or str): Month evaluated.
+            training (pd.DataFrame): One row per (model, day): the model params plus "pnl", "model_num" and
+                "day", as in `WalkForward.run()["training"]` or `past_mth_test_YYYY-MM.csv`.
+        """
+        month = self._month_key(month)
+        training = training.reset_index(drop = True).assign(day = pd.to_datetime(training.loc[:, "day"].to_numpy()))
+        pnl = training.loc[:, "pnl"].to_numpy(dtype = float)
+        stats = training.assign(wins = pnl > 0, pnl_sq = pnl ** 2)
+        rows = list()
+        for param in [x for x in training.columns if x not in self.TRAINING_COLUMNS]:
+            by_value = stats.groupby(param).agg(count = ("pnl", "size"), wins = ("wins", "sum"), pnl = ("pnl", "sum"), pnl_sq = ("pnl_sq", "sum"))
+            rows += [(month, param, self._value_key(value), int(row["count"]), int(row.wins), float(row.pnl), float(row.pnl_sq)) for value, row in by_value.iterrows()]
+
+        self._write(training, "training", month)
+        with self.connection:
+            self.connection.execute("DELETE FROM attribution WHERE source = 'training' AND month = ?", (month,))
+            self.connection.executemany("INSERT INTO attribution VALUES ('training', ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.connection.execute("INSERT OR REPLACE INTO months VALUES ('training', ?, ?)", (month, len(training)))
+
+    def _write(self, df, kind, month):
+        directory = self._partition(kind, month)
+        if len(df) == 0:
+            if os.path.exists(os.path.join(directory, "part-0.parquet")):
+                os.remove(os.path.join(directory, "part-0.parquet"))
+            return
+        DataStore._write(pa.Table.from_pandas(df, preserve_index = False), directory, "part-0")
+
+    def _update_equity(self, first_day):
+        """ Recompute equity and peak from `first_day` on, carrying them from the day before. """
+        previous = self.connection.execute("SELECT equity, peak FROM daily WHERE day < ? ORDER BY day DESC LIMIT 1", (first_day,)).fetchone()
+        equity, peak = previous if previous is not None else (self.initial_aum, self.initial_aum)
+        rows = self.connection.execute("SELECT day, pnl FROM daily WHERE day >= ? ORDER BY day", (first_day,)).fetchall()
+        if len(rows) == 0:
+            return
+        equity = equity + np.cumsum([pnl for _, pnl in rows])
+        peak = np.maximum(peak, np.maximum.accumulate(equity))
+        self.connection.executemany("UPDATE daily SET equity = ?, peak = ? WHERE day = ?",
+            [(float(equity[i]), float(peak[i]), day) for i, (day, _) in enumerate(rows)])
+
+    # Reporting
+    def equity_curve(self):
+        """ Daily PnL, trade count, equity, running peak and drawdown (fraction of peak) of the archived trades. """
+        df = pd.read_sql("SELECT day, trades, pnl, equity, peak FROM daily ORDER BY day", self.connection, parse_dates = ["day"]).set_index("day")
+        return df.assign(drawdown = df.loc[:, "equity"] / df.loc[:, "peak"] - 1)
+
+    def exit_reasons(self):
+        """ Trades, wins, win rate, PnL and share of total PnL by exit reason. """
+        df = pd.read_sql("""
+            SELECT exit_reason, SUM(trades) AS trades, SUM(wins) AS wins, SUM(pnl) AS pnl, SUM(gross_profit) AS gross_profit, SUM(gross_loss) AS gross_loss
+            FROM exit_reasons GROUP BY exit_reason ORDER BY exit_reason
+        """, self.connection).set_index("exit_reason")
+        return df.assign(win_rate = df.loc[:, "wins"] / df.loc[:, "trades"], pnl_share = df.loc[:, "pnl"] / df.loc[:, "pnl"].sum())
+
+    def trade_stats(self):
+        """ Totals over all archived trades.
+
+        Returns:
+            dict: "trades", "wins", "win_rate", "pnl", "avg_win", "avg_loss", "profit_factor", "max_drawdown"
+                (most negative drawdown, as a fraction of the peak) and "final_equity".
+        """
+        trades, wins, pnl, gross_profit, gross_loss = self.connection.execute(
+            "SELECT COALESCE(SUM(trades), 0), COALESCE(SUM(wins), 0), COALESCE(SUM(pnl), 0), COALESCE(SUM(gross_profit), 0), COALESCE(SUM(gross_loss), 0) FROM exit_reasons").fetchone()
+        max_drawdown, final_equity = self.connection.execute(
+            "SELECT COALESCE(MIN(equity / peak - 1), 0), (SELECT equity FROM daily ORDER BY day DESC LIMIT 1) FROM daily").fetchone()
+        return {
+            "trades": trades,
+            "wins": wins,
+            "win_rate": wins / trades if trades > 0 else np.nan,
+            "pnl": pnl,
+            "avg_win": gross_profit / wins if wins > 0 else np.nan,
+            "avg_loss": gross_loss / (trades - wins) if trades > wins else np.nan,
+            "profit_factor": gross_profit / -gross_loss if gross_loss < 0 else np.nan,
+            "max_drawdown": max_drawdown,
+            "final_equity": self.initial_aum if final_equity is None else final_equity,
+        }
+
+    def attribution(self, source = "training"):
+        """ PnL by value of each parameter.
+
+        Args:
+            source (str): "training" for the per-model daily PnL (one observation per model-day), or "trades"
+                for the actual trades (one observation per trade) of the months archived with their params.
+
+        Returns:
+            pd.DataFrame: Indexed by (param, value), with count, wins, win_rate, pnl, mean, std and
+                ratio (mean / std, the ranking criterion of `WalkForward.rank_models`).
+        """
+        df = pd.read_sql("""
+            SELECT param, value, SUM(count) AS count, SUM(wins) AS wins, SUM(pnl) AS pnl, SUM(pnl_sq) AS pnl_sq
+            FROM attribution WHERE source = ? GROUP BY param, value
+        """, self.connection, params = (source,))
+        df = df.assign(value = [json.loads(x) for x in df.loc[:, "value"]])
+        count = df.loc[:, "count"].to_numpy(dtype = float)
+        mean = df.loc[:, "pnl"].to_numpy(dtype = float) / count
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            std = np.sqrt(np.maximum(df.loc[:, "pnl_sq"].to_numpy(dtype = float) - count * mean ** 2, 0) / (count - 1))
+            ratio = mean / std
+        df = df.assign(win_rate = df.loc[:, "wins"] / count, mean = mean, std = np.where(count > 1, std, np.nan), ratio = np.where(np.isfinite(ratio), ratio, np.nan))
+        return df.drop(columns = "pnl_sq").sort_values(["param", "value"]).set_index(["param", "value"])
+
+    def summary(self):
+        """ All reports at once: "trade_stats", "equity_curve", "exit_reasons", "attribution" and "traded_attribution". """
+        return {
+            "trade_stats": self.trade_stats(),
+            "equity_curve": self.equity_curve(),
+            "exit_reasons": self.exit_reasons(),
+            "attribution": self.attribution("training"),
+            "traded_attribution": self.attribution("trades"),
+        }
+
+    # Raw records
+    def trades(self, months = None, columns = None):
+        """ Archived trade records, optionally restricted to some months and columns. """
+        return self._read("trades", months, columns, DayTrade.TRADE_COLUMNS + ["day"])
+
+    def training(self, months = None, columns = None):
+        """ Archived per-model daily PnL, optionally restricted to some months and columns. """
+        return self._read("training", months, columns, self.TRAINING_COLUMNS)
+
+    def _read(self, kind, months, columns, empty_columns):
+        months = self.months(kind) if months is None else [self._month_key(x) for x in months]
+        paths = [os.path.join(self._partition(kind, x), "part-0.parquet") for x in months]
+        tables = [pq.read_table(x, columns = columns) for x in paths if os.path.exists(x)]
+        if len(tables) == 0:
+            return pd.DataFrame(columns = empty_columns if columns is None else columns)
+        return pa.concat_tables(tables, promote_options = "permissive").to_pandas().reset_index(drop = True)
+
+    # Migration
+    def ingest_results_dir(self, results_dir = "results", overwrite = False):
+        """ Archive the months of a `WalkForward` results directory that are not archived yet.
+
+        Reads `past_mth_test_YYYY-MM.csv` as training months, and `trading_mth_test.csv` with
+        `trade_summary.csv` (for the trading days and each month's model params) as trades.
+
+        Returns:
+            dict: Months appended, as {"training": [...], "trades": [...]}.
+        """
+        appended = {"training": list(), "trades": list()}
+        archived = set(self.months("training"))
+        for file_name in sorted(os.listdir(results_dir)):
+            match = re.fullmatch(r"past_mth_test_(\d{4}-\d{2})\.csv", file_name)
+            if match is None or (match.group(1) in archived and not overwrite):
+                continue
+            self.append_training(match.group(1), pd.read_csv(os.path.join(results_dir, file_name), parse_dates = ["day"]).drop(columns = "Unnamed: 0"))
+            appended["training"].append(match.group(1))
+
+        trades_path = os.path.join(results_dir, "trading_mth_test.csv")
+        if not os.path.exists(trades_path):
+            return appended
+        trades = pd.read_csv(trades_path).drop(columns = "Unnamed: 0")
+        trades_month = pd.to_datetime(trades.loc[:, "entry_time"], utc = True).dt.tz_convert(DataStore.TIMEZONE).dt.strftime("%Y-%m")
+        summary_path = os.path.join(results_dir, "trade_summary.csv")
+        summary = pd.read_csv(summary_path, parse_dates = ["day"]).drop(columns = "Unnamed: 0") if os.path.exists(summary_path) else None
+        summary_month = summary.loc[:, "day"].dt.strftime("%Y-%m") if summary is not None else None
+        months = sorted(set(trades_month) | (set(summary_month) if summary is not None else set()))
+        archived = set(self.months("trades"))
+        for month in months:
+            if month in archived and not overwrite:
+                continue
+            days, params = None, None
+            if summary is not None:
+                month_summary = summary[summary_month == month]
+                days = list(month_summary.loc[:, "day"])
+                params = month_summary.drop(columns = self.TRAINING_COLUMNS).iloc[0].to_dict() if month_summary.loc[:, "model_num"].nunique() == 1 else None
+            self.append_trades(month, trades[(trades_month == month).to_numpy()], days = days, params = params)
+            appended["trades"].append(month)
+        return appended
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Archive a walk-forward results directory and print its analytics.")
+    parser.add_argument("--results-dir", default = "results")
+    parser.add_argument("--archive", default = "results/archive")
+    parser.add_argument("--initial-aum", type = float, default = 6.5 * 1e6)
+    parser.add_argument("--overwrite", action = "store_true")
+    args = parser.parse_args()
+    archive = ResultsArchive(args.archive, initial_aum = args.initial_aum)
+    appended = archive.ingest_results_dir(args.results_dir, overwrite = args.overwrite)
+    print(f"Archived {len(appended['training'])} training months and {len(appended['trades'])} trading months to {args.archive}")
+    for name, value in archive.trade_stats().items():
+        print(f"{name}: {value}")
+    print(archive.exit_reasons())
@@ -1,11 +1,20 @@
 import pandas as pd
 import numpy as np
-import ta
 from itertools import product
 
+from src.IndicatorCache import IndicatorCache
+from src.Instrumentation import instrumentation
+
 class Strategy:
-    def __init__(self):
-        self.params_grid = {
+    # Params read by entry_exit_signals; models that agree on these trade on identical signals
+    SIGNAL_PARAMS = ["fast", "slow_mult", "rsi_threshold"]
+    # Last axis of `signal_matrix`, in the order entry_exit_signals returns them
+    SIGNALS = ["enter_long", "exit_long", "enter_short", "exit_short"]
+    # Shared by all instances so indicators computed for a day are reused across strategies and reruns
+    indicator_cache = IndicatorCache()
+
+    def __init__(self, params_grid = None):
+        self.params_grid = params_grid if params_grid is not None else {
             "fast": [20, 30], #sma|rsi|macd
             "slow_mult": [3], # sma|rsi|macd, for ATR also
 
@@ -17,6 +26,7 @@ class Strategy:
             "stoploss_pct_of_maxprofit" : [.1, .5, 1.],
         }
         self.tech_indicators = None
+        self._signal_cache = None # (tech_indicators, models, signal_matrix output) of the last day evaluated
         self.models = [{list(self.params_grid.keys())[i] : x[i] for i in range(len(x))} for x in list(product(*self.params_grid.values()))]
 
     def get_models(self, model_num = None):
@@ -24,51 +34,136 @@ class Strategy:
             return self.models[model_num]
         return self.models
 
+    def signal_groups(self):
+        """ Group model numbers by the params that drive their entry/exit signals.
+
+        Returns:
+            dict: Maps each tuple of `SIGNAL_PARAMS` values to the list of model numbers sharing it.
+        """
+        groups = dict()
+        for model_num, params in enumerate(self.models):
+            groups.setdefault(tuple(params[x] for x in self.SIGNAL_PARAMS), list()).append(model_num)
+        return groups
+
+    def indicator_plan(self):
+        """ Distinct indicator columns needed by the grid, in column order.
+
+        Only the TA params (fast, slow_mult) are expanded, so the plan grows with the number of distinct
+        windows rather than with the full params_grid.
+
+        Returns:
+            dict: Maps each tech_indicators column name to its `IndicatorCache` spec.
+        """
+        plan = dict()
+        for fast, slow_mult in product(self.params_grid["fast"], self.params_grid["slow_mult"]):
+            slow = fast * slow_mult
+            plan.setdefault(f"sma_{fast}", ("sma", fast))
+            plan.setdefault(f"sma_{slow}", ("sma", slow))
+            plan.setdefault(f"rsi_{slow}", ("rsi", slow))
+            plan.setdefault(f"macdsignal_{fast}_{slow}", ("macdsignal", fast, slow))
+            plan.setdefault(f"macddiff_{fast}_{slow}", ("macddiff", fast, slow))
+            plan.setdefault(f"atr_{slow}", ("atr", slow))
+        return plan
+
     def compute_tech_indicators(self, df_stock, ret = False):
-        tech_indicators = dict()
-        for params in product(*self.params_grid.values()):
-            params = {list(self.params_grid.keys())[i] : params[i] for i in range(len(params))}
-
-            fast = params['fast']
-            slow = params['fast'] * params["slow_mult"]
-            tech_indicators[f"sma_{fast}"] = ta.trend.SMAIndicator(df_stock['close'], window=fast).sma_indicator()
-            tech_indicators[f"sma_{slow}"] = ta.trend.SMAIndicator(df_stock['close'], window=slow).sma_indicator()
-            tech_indicators[f"rsi_{slow}"] = ta.momentum.RSIIndicator(df_stock['close'], window=slow).rsi()
-            tech_indicators[f"macdsignal_{fast}_{slow}"] = ta.trend.MACD(df_stock['close'], window_fast=fast, window_slow=slow).macd_signal()
-            tech_indicators[f"macddiff_{fast}_{slow}"] = ta.trend.MACD(df_stock['close'], window_fast=fast, window_slow=slow).macd_diff()
-            tech_indicators[f"atr_{slow}"] = ta.volatility.AverageTrueRange(df_stock['high'], df_stock['low'], df_stock['close'], window=slow).average_true_range()
-        tech_indicators = pd.DataFrame(tech_indicators).dropna()
+        with instrumentation.timer("strategy.compute_tech_indicators"):
+            fingerprint = self.indicator_cache.fingerprint(df_stock)
+            tech_indicators = {column : self.indicator_cache.get(df_stock, spec, fingerprint = fingerprint) for column, spec in self.indicator_plan().items()}
+            tech_indicators = pd.DataFrame(tech_indicators).dropna()
 
         self.tech_indicators = tech_indicators
         if ret:
             return tech_indicators
     
-    def entry_exit_signals(self, params = None, model_num = None):
+    def entry_exit_signals(self, params = None, model_num = None, tech_indicators = None):
         if params is None:
             params = self.models[model_num]
             if model_num is None:
                 raise ValueError("Either params or model_num must be provided.")
+        if tech_indicators is None:
+            tech_indicators = self.tech_indicators
 
         enter_long = pd.Series(np.all([
-            (self.tech_indicators[f"sma_{params['fast']}"] > self.tech_indicators[f"sma_{params['fast'] * params['slow_mult']}"]), # SMA_fast > SMA_slow
-            (self.tech_indicators[f"macddiff_{params['fast']}_{params['fast'] * params['slow_mult']}"] > 0), # MACD diff > 0
-            (self.tech_indicators[f"rsi_{params['fast'] * params['slow_mult']}"] <= params["rsi_threshold"]) # RSI not > 60
-        ], axis = 0), index = self.tech_indicators.index)
+            (tech_indicators[f"sma_{params['fast']}"] > tech_indicators[f"sma_{params['fast'] * params['slow_mult']}"]), # SMA_fast > SMA_slow
+            (tech_indicators[f"macddiff_{params['fast']}_{params['fast'] * params['slow_mult']}"] > 0), # MACD diff > 0
+            (tech_indicators[f"rsi_{params['fast'] * params['slow_mult']}"] <= params["rsi_threshold"]) # RSI not > 60
+        ], axis = 0), index = tech_indicators.index)
 
         exit_long = pd.Series(np.any([
             # RSI > 60
-            self.tech_indicators[f"rsi_{params['fast'] * params['slow_mult']}"] > params["rsi_threshold"]
-        ], axis = 0), index = self.tech_indicators.index)
+            tech_indicators[f"rsi_{params['fast'] * params['slow_mult']}"] > params["rsi_threshold"]
+        ], axis = 0), index = tech_indicators.index)
 
         enter_short = pd.Series(np.all([
-            (self.tech_indicators[f"sma_{params['fast']}"] < self.tech_indicators[f"sma_{params['fast'] * params['slow_mult']}"]), # SMA_fast > SMA_slow
-            (self.tech_indicators[f"macddiff_{params['fast']}_{params['fast'] * params['slow_mult']}"] < 0), # MACD diff > 0
-            (self.tech_indicators[f"rsi_{params['fast'] * params['slow_mult']}"] >= 100 - params["rsi_threshold"]) # RSI not > 60
-        ], axis = 0), index = self.tech_indicators.index)
+            (tech_indicators[f"sma_{params['fast']}"] < tech_indicators[f"sma_{params['fast'] * params['slow_mult']}"]), # SMA_fast > SMA_slow
+            (tech_indicators[f"macddiff_{params['fast']}_{params['fast'] * params['slow_mult']}"] < 0), # MACD diff > 0
+            (tech_indicators[f"rsi_{params['fast'] * params['slow_mult']}"] >= 100 - params["rsi_threshold"]) # RSI not > 60
+        ], axis = 0), index = tech_indicators.index)
 
         exit_short = pd.Series(np.any([
             # RSI > 60
-            self.tech_indicators[f"rsi_{params['fast'] * params['slow_mult']}"] < 100 - params["rsi_threshold"]
-        ], axis = 0), index = self.tech_indicators.index)
+            tech_indicators[f"rsi_{params['fast'] * params['slow_mult']}"] < 100 - params["rsi_threshold"]
+        ], axis = 0), index = tech_indicators.index)
+
+        return enter_long, exit_long, enter_short, exit_short
+
+    def signal_matrix(self, tech_indicators = None):
+        """ Entry/exit signals of every signal config in one vectorised pass over the indicator table.
+
+        A signal config is a distinct combination of `SIGNAL_PARAMS` (see `signal_groups`). Signals are
+        the same as `entry_exit_signals` returns for any model of the config. The result for
+        `self.tech_indicators` is cached until the indicators or the models change.
+
+        Returns:
+            tuple: (signals, model_signal). `signals` is a bool array of shape (minutes, configs, 4) with
+                the last axis ordered as `SIGNALS`; `model_signal[model_num]` is the config of a model.
+        """
+        if tech_indicators is None:
+            tech_indicators = self.tech_indicators
+            cache = self._signal_cache
+            if cache is not None and cache[0] is tech_indicators and cache[1] is self.models:
+                return cache[2]
+
+        instrumentation.count("strategy.signal_matrix")
+        groups = self.signal_groups()
+        model_signal = np.zeros(len(self.models), dtype = int)
+        for g, model_nums in enumerate(groups.values()):
+            model_signal[model_nums] = g
+        configs = [dict(zip(self.SIGNAL_PARAMS, x)) for x in groups]
+        values = tech_indicators.to_numpy(dtype = float)
+        def column_values(names):
+            positions = tech_indicators.columns.get_indexer(names)
+            if np.any(positions < 0):
+                raise KeyError(f"Missing tech indicators: {[x for x, k in zip(names, positions) if k < 0]}")
+            return values[:, positions]
+
+        sma_fast = column_values([f"sma_{x['fast']}" for x in configs])
+        sma_slow = column_values([f"sma_{x['fast'] * x['slow_mult']}" for x in configs])
+        macd_diff = column_values([f"macddiff_{x['fast']}_{x['fast'] * x['slow_mult']}" for x in configs])
+        rsi = column_values([f"rsi_{x['fast'] * x['slow_mult']}" for x in configs])
+        rsi_threshold = np.array([x["rsi_threshold"] for x in configs], dtype = float)
+
+        signals = np.empty((len(values), len(configs), 4), dtype = bool)
+        signals[:, :, 0] = (sma_fast > sma_slow) & (macd_diff > 0) & (rsi <= rsi_threshold)
+        signals[:, :, 1] = rsi > rsi_threshold
+        signals[:, :, 2] = (sma_fast < sma_slow) & (macd_diff < 0) & (rsi >= 100 - rsi_threshold)
+        signals[:, :, 3] = rsi < 100 - rsi_threshold
+
+        if tech_indicators is self.tech_indicators:
+            self._signal_cache = (tech_indicators, self.models, (signals, model_signal))
+        return signals, model_signal
+
+    def model_signals(self, model_num):
+        """ `entry_exit_signals(model_num = model_num)` taken from the cached `signal_matrix`. """
+        signals, model_signal = self.signal_matrix()
+        return tuple(pd.Series(signals[:, model_signal[model_num], x], index = self.tech_indicators.index) for x in range(4))
+
+    @staticmethod
+    def pack_signals(signals):
+        """ `signal_matrix` signals packed along the minutes axis into uint8, 8 minutes per byte. """
+        return np.packbits(signals, axis = 0)
 
-        return enter_long, exit_long, enter_short, exit_short
\ No newline at end of file
+    @staticmethod
+    def unpack_signals(packed, n_minutes):
+        """ Inverse of `pack_signals`. """
+        return np.unpackbits(packed, axis = 0, count = n_minutes).astype(bool)
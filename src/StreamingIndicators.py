@@ -0,0 +1,229 @@
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+class RollingMean:
+    """ O(1) update of `series.rolling(window, min_periods = window).mean()`.
+
+    Replicates pandas' rolling mean kernel (compensated add/remove sums, constant-run and sign
+    corrections) so values match the batch indicators bit for bit.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._values = deque()
+        self._nobs = 0
+        self._sum = 0.
+        self._neg_ct = 0
+        self._compensation_add = 0.
+        self._compensation_remove = 0.
+        self._same_count = 0
+        self._prev_value = None
+
+    def _add(self, value):
+        if value == value:
+            self._nobs += 1
+            y = value - self._compensation_add
+            t = self._sum + y
+            self._compensation_add = t - self._sum - y
+            self._sum = t
+            if math.copysign(1., value) < 0:
+                self._neg_ct += 1
+            self._same_count = self._same_count + 1 if value == self._prev_value else 1
+            self._prev_value = value
+
+    def _remove(self, value):
+        if value == value:
+            self._nobs -= 1
+            y = -value - self._compensation_remove
+            t = self._sum + y
+            self._compensation_remove = t - self._sum - y
+            self._sum = t
+            if math.copysign(1., value) < 0:
+                self._neg_ct -= 1
+
+    def update(self, value):
+        value = float(value)
+        if len(self._values) == 0 or self.window == 1:
+            self._values.clear()
+            self._nobs, self._sum, self._neg_ct = 0, 0., 0
+            self._compensation_add, self._compensation_remove = 0., 0.
+            self._same_count, self._prev_value = 0, value
+        elif len(self._values) == self.window:
+            self._remove(self._values.popleft())
+        self._values.append(value)
+        self._add(value)
+
+        if self._nobs < self.window or self._nobs == 0:
+            return np.nan
+        result = self._sum / self._nobs
+        if self._same_count >= self._nobs:
+            result = self._prev_value
+        elif self._neg_ct == 0 and result < 0:
+            result = 0.
+        elif self._neg_ct == self._nobs and result > 0:
+            result = 0.
+        return result
+
+
+class ExponentialMean:
+    """ O(1) update of `series.ewm(..., min_periods = min_periods, adjust = False).mean()`. """
+
+    def __init__(self, span = None, alpha = None, min_periods = 0):
+        # Same float arithmetic as pandas' conversion of span/alpha to the center of mass and back
+        com = (span - 1) / 2. if span is not None else (1 - alpha) / alpha
+        self.alpha = 1. / (1. + com)
+        self.min_periods = max(min_periods, 1)
+        self._weighted = np.nan
+        self._old_wt = 1.
+        self._nobs = 0
+
+    def update(self, value):
+        value = float(value)
+        is_observation = value == value
+        self._nobs += is_observation
+        if self._weighted == self._weighted:
+            # Gaps (NaN) keep decaying the old weight until the next observation
+            self._old_wt *= 1. - self.alpha
+            if is_observation:
+                if self._weighted != value:
+                    self._weighted = (self._old_wt * self._weighted + self.alpha * value) / (self._old_wt + self.alpha)
+                self._old_wt = 1.
+        elif is_observation:
+            self._weighted = value
+        return self._weighted if self._nobs >= self.min_periods else np.nan
+
+
+class RSI:
+    """ O(1) update of `ta.momentum.RSIIndicator(close, window).rsi()`. """
+
+    def __init__(self, window):
+        self._up = ExponentialMean(alpha = 1 / window, min_periods = window)
+        self._down = ExponentialMean(alpha = 1 / window, min_periods = window)
+        self._prev_close = np.nan
+
+    def update(self, close):
+        diff = close - self._prev_close
+        self._prev_close = close
+        up = self._up.update(diff if diff > 0 else 0.)
+        down = self._down.update(-diff if diff < 0 else -0.)
+        if down == 0:
+            return 100.
+        return 100 - (100 / (1 + up / down))
+
+
+class MACD:
+    """ O(1) update of the signal and diff lines of `ta.trend.MACD(close, fast, slow)`. """
+
+    def __init__(self, fast, slow, sign = 9):
+        self._fast = ExponentialMean(span = fast, min_periods = fast)
+        self._slow = ExponentialMean(span = slow, min_periods = slow)
+        self._signal = ExponentialMean(span = sign, min_periods = sign)
+
+    def update(self, close):
+        macd = self._fast.update(close) - self._slow.update(close)
+        signal = self._signal.update(macd)
+        return signal, macd - signal
+
+
+class ATR:
+    """ O(1) update of `IndicatorCache.average_true_range` (zeros until the first full window). """
+
+    def __init__(self, window):
+        self.window = window
+        self._true_ranges = list()
+        self._prev_close = np.nan
+        self._atr = 0.
+        self._seeded = False
+
+    def update(self, high, low, close):
+        true_range = np.nanmax([high - low, abs(high - self._prev_close), abs(low - self._prev_close)])
+        self._prev_close = close
+        if not self._seeded:
+            self._true_ranges.append(true_range)
+            if len(self._true_ranges) == self.window:
+                # Seed with the mean of the first window, summed as Series.mean does
+                true_ranges = np.array(self._true_ranges)
+                valid = ~np.isnan(true_ranges)
+                self._atr = np.where(valid, true_ranges, 0.).sum() / float(valid.sum())
+                self._true_ranges = list()
+                self._seeded = True
+        else:
+            self._atr = (self._atr * (self.window - 1) + true_range) / float(self.window)
+        return float(self._atr)
+
+
+class StreamingIndicators:
+    """ Incremental counterpart of `Strategy.compute_tech_indicators` for live 1-minute bars.
+
+    Every indicator of the plan keeps O(1) state, so each new bar costs the same regardless of how much
+    of the day has been seen. Fed the bars of a day in order, `update` returns the same values as the
+    batch `tech_indicators` row for that minute.
+    """
+
+    def __init__(self, plan):
+        """
+        Args:
+            plan (dict): Column -> indicator spec, as returned by `Strategy.indicator_plan`.
+        """
+        self.columns = list(plan.keys())
+        self._updaters = dict()
+        self._specs = dict()
+        for column, spec in plan.items():
+            match spec:
+                case ("sma", window):
+                    key = spec
+                    self._updaters.setdefault(key, (RollingMean(window), ("close",)))
+                case ("rsi", window):
+                    key = spec
+                    self._updaters.setdefault(key, (RSI(window), ("close",)))
+                case ("atr", window):
+                    key = spec
+                    self._updaters.setdefault(key, (ATR(window), ("high", "low", "close")))
+                case ("macdsignal" | "macddiff", fast, slow):
+                    key = ("macd", fast, slow)
+                    self._updaters.setdefault(key, (MACD(fast, slow), ("close",)))
+                case _:
+                    raise ValueError(f"Unknown indicator spec: {spec}")
+            self._specs[column] = (key, 1 if spec[0] == "macddiff" else 0 if spec[0] == "macdsignal" else None)
+        self.time = None
+        self.row = None
+        # Per-bar memo for consumers sharing this instance, e.g. signals of models with the same signal params
+        self.bar_cache = dict()
+
+    def update(self, bar_time, bar):
+        """ Add the bar of `bar_time` and return the indicator row for it.
+
+        Calling again with the same `bar_time` returns the cached row, so one instance can be shared
+        by several consumers of the same feed.
+
+        Args:
+            bar_time (pd.Timestamp): Bar timestamp.
+            bar (dict-like): Bar with high, low and close.
+
+        Returns:
+            dict: Column -> value; NaN while an indicator is warming up.
+        """
+        if self.time is not None and bar_time == self.time:
+            return self.row
+        values = dict()
+        for key, (updater, fields) in self._updaters.items():
+            values[key] = updater.update(*[float(bar[x]) for x in fields])
+        self.row = {column: values[key] if part is None else values[key][part] for column, (key, part) in self._specs.items()}
+        self.time = bar_time
+        self.bar_cache = dict()
+        return self.row
+
+    @property
+    def frame(self):
+        """ Latest row as a one-row DataFrame indexed by its bar time, in `tech_indicators` layout. """
+        if "frame" not in self.bar_cache:
+            self.bar_cache["frame"] = pd.DataFrame([self.row], index = [self.time], columns = self.columns)
+        return self.bar_cache["frame"]
+
+    @property
+    def ready(self):
+        """ True when the latest row has every indicator, i.e. it survives `compute_tech_indicators`' dropna. """
+        return self.row is not None and not any(x != x for x in self.row.values())
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from src.BlackScholes import BlackScholes
+
+class SyntheticData:
+    """ Deterministic synthetic SPY days for benchmarks and offline runs.
+
+    Stock bars cover the same 0630-1500H window `DataUpdateModule` fetches, and options snapshots carry
+    the columns `DataUpdateModule._parse_options_data` keeps, priced with Black-Scholes on a smile and
+    quoted in cents. The same (seed, trade_date, ...) always produces the same data.
+    """
+    TIMEZONE = "America/New_York"
+    OPTIONS_COLUMNS = [
+        "strike", "stockPrice", "callDelta", "putDelta", 'callMidIv', 'putMidIv',
+        'callOpenInterest', 'callVolume', 'callBidSize', 'callAskSize', 'callBidPrice', 'callAskPrice',
+        'putOpenInterest', 'putVolume', 'putBidSize', 'putAskSize', 'putBidPrice', 'putAskPrice', 'time'
+    ]
+
+    def __init__(self, seed = 0, spot = 470., minute_volatility = 0.0006, base_iv = 0.15, missing_strike_prob = 0.03):
+        self.seed = seed
+        self.spot = spot
+        self.minute_volatility = minute_volatility
+        self.base_iv = base_iv
+        self.missing_strike_prob = missing_strike_prob
+
+    def _rng(self, trade_date, stream):
+        return np.random.default_rng([self.seed, trade_date.toordinal(), stream])
+
+    def stock_data(self, trade_date):
+        """ 1-minute SPY bars of a day, shaped like `DataUpdateModule._get_stock_data` output. """
+        rng = self._rng(trade_date, 0)
+        day = pd.Timestamp(trade_date).strftime("%Y-%m-%d")
+        index = pd.date_range(f"{day} 06:30", f"{day} 15:00", freq = "1min", tz = self.TIMEZONE, name = "datetime")
+        returns = rng.normal(0, self.minute_volatility, len(index)) + rng.normal(0, 0.0003) * np.sin(np.arange(len(index)) / rng.uniform(20, 80))
+        close = self.spot * rng.uniform(0.9, 1.1) * np.exp(np.cumsum(returns))
+        open_ = np.r_[close[0], close[:-1]]
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.0002, len(index))))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.0002, len(index))))
+        return pd.DataFrame({
+            "open": open_.round(4), "high": high.round(4), "low": low.round(4), "close": close.round(4),
+            "volume": rng.integers(10_000, 100_000, len(index)),
+        }, index = index)
+
+    def options_data(self, trade_date, df_stock = None, interval = 5, width = 30):
+        """ 0DTE chain snapshots every `interval` minutes from 0930 to 1500H.
+
+        Args:
+            df_stock (pd.DataFrame): Bars of the day; `stock_data(trade_date)` if not given.
+            width (int): Strikes quoted on each side of the ATM strike, at $1 increments.
+
+        Returns:
+            pd.DataFrame: Long-format chain in the layout of `DataUpdateModule.read_data`.
+        """
+        if df_stock is None:
+            df_stock = self.stock_data(trade_date)
+        rng = self._rng(trade_date, interval * 1000 + width)
+        day = pd.Timestamp(trade_date).strftime("%Y-%m-%d")
+        times = pd.date_range(f"{day} 09:30", f"{day} 15:00", freq = f"{interval}min", tz = self.TIMEZONE)
+        spots = df_stock.loc[:, "close"].asof(times).to_numpy().round(2)
+
+        # One row per (snapshot, strike), strikes centred on each snapshot's ATM
+        offsets = np.arange(-width, width + 1)
+        time_idx = np.repeat(np.arange(len(times)), len(offsets))
+        spot = spots[time_idx]
+        strike = (np.round(spots)[:, None] + offsets[None, :]).ravel().astype(float)
+        keep = rng.random(len(strike)) >= self.missing_strike_prob
+        time_idx, spot, strike = time_idx[keep], spot[keep], strike[keep]
+        n = len(strike)
+
+        # Black-Scholes on a smile, expiring at 1600H
+        expiry = pd.Timestamp(f"{day} 16:00", tz = self.TIMEZONE)
+        years = np.maximum((expiry - times).total_seconds().to_numpy()[time_idx] / (365 * 86400), 1e-6)
+        iv = self.base_iv + 0.002 * np.abs(strike - spot)
+        d1, _ = BlackScholes.d1_d2(spot, strike, years, iv)
+        call, put = BlackScholes.prices(spot, strike, years, iv)
+        half_spread = 0.01 + 0.02 * np.abs(strike - spot) / 5
+
+        def bid_ask(mid):
+            return np.maximum(np.round(mid - half_spread, 2), 0.), np.where(mid > 0.005, np.round(mid + half_spread, 2), 0.01)
+
+        call_bid, call_ask = bid_ask(call)
+        put_bid, put_ask = bid_ask(put)
+        sizes = rng.integers(0, 5000, (8, n))
+        df_options = pd.DataFrame({
+            "strike": strike, "stockPrice": spot, "callDelta": ndtr(d1), "putDelta": ndtr(d1) - 1,
+            "callMidIv": iv, "putMidIv": iv,
+            "callOpenInterest": sizes[0], "callVolume": sizes[1], "callBidSize": sizes[2] % 500 + 1, "callAskSize": sizes[3] % 500 + 1,
+            "callBidPrice": call_bid, "callAskPrice": call_ask,
+            "putOpenInterest": sizes[4], "putVolume": sizes[5], "putBidSize": sizes[6] % 500 + 1, "putAskSize": sizes[7] % 500 + 1,
+            "putBidPrice": put_bid, "putAskPrice": put_ask,
+            "time": times[time_idx],
+        })
+        return df_options.loc[:, self.OPTIONS_COLUMNS]
+
+    def day(self, trade_date, interval = 5, width = 30):
+        """ (df_stock, df_options) of a synthetic trading day. """
+        df_stock = self.stock_data(trade_date)
+        return df_stock, self.options_data(trade_date, df_stock, interval = interval, width = width)
+
+    def write(self, store, trade_dates, interval = 5, width = 30):
+        """ Write synthetic days to a `DataStore`. """
+        for trade_date in trade_dates:
+            df_stock, df_options = self.day(trade_date, interval = interval, width = width)
+            store.write_stock(trade_date, df_stock)
+            store.write_options(trade_date, df_options)
@@ -0,0 +1,364 @@
+import os
+import copy
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from src.DayTrade import DayTrade
+from src.Instrumentation import instrumentation
+from src.OptionsChain import OptionsChain
+from src.ResultCache import ResultCache
+
+class SharedArrays:
+    """ A dict of numpy arrays packed into one `multiprocessing.shared_memory` block.
+
+    The creating process owns the block and must `unlink` it; other processes `attach` with the small,
+    picklable `descriptor` and get zero-copy views.
+    """
+
+    def __init__(self, arrays):
+        layout = dict()
+        offset = 0
+        for key, values in arrays.items():
+            values = np.ascontiguousarray(values)
+            offset = -(-offset // 64) * 64 # align every array to 64 bytes
+            layout[key] = (offset, values.shape, values.dtype.str)
+            offset += values.nbytes
+        self.shm = shared_memory.SharedMemory(create = True, size = max(offset, 1))
+        self.descriptor = (self.shm.name, layout)
+        for key, values in self.views(self.shm, layout).items():
+            values[...] = arrays[key]
+
+    @staticmethod
+    def views(shm, layout):
+        return {key: np.ndarray(shape, dtype = np.dtype(dtype), buffer = shm.buf, offset = offset) for key, (offset, shape, dtype) in layout.items()}
+
+    @classmethod
+    def attach(cls, descriptor):
+        """ (SharedMemory, arrays) for a descriptor created in another process. Keep the handle alive while using the arrays. """
+        name, layout = descriptor
+        shm = shared_memory.SharedMemory(name = name)
+        return shm, cls.views(shm, layout)
+
+    def unlink(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Worker side: the strategy is sent once per process, day data arrives through shared memory
+_worker_strategy = None
+
+def _init_worker(strategy, instrumented):
+    global _worker_strategy
+    _worker_strategy = strategy
+    # Forked workers inherit the parent's collection so far; start empty and send back per-day reports
+    instrumentation.reset()
+    instrumentation.enabled = instrumented
+
+def _trade_day_gross(descriptor, tz, indicator_columns, interval, model_nums):
+    shm, arrays = SharedArrays.attach(descriptor)
+    try:
+        chain = OptionsChain.from_arrays({key[6:]: values for key, values in arrays.items() if key.startswith("chain:")}, tz)
+        strategy = _strategy_subset(_worker_strategy, model_nums)
+        strategy.tech_indicators = pd.DataFrame(
+            arrays["indicators"],
+            index = pd.DatetimeIndex(arrays["indicator_times"]).tz_localize("UTC").tz_convert(tz),
+            columns = indicator_columns,
+        )
+        gross_trades = DayTrade.trade_all_gross(strategy, None, interval = interval, chain = chain)
+        report = instrumentation.report() if instrumentation.enabled else None
+        instrumentation.reset()
+        return gross_trades, report
+    finally:
+        _worker_strategy.tech_indicators = None
+        shm.close()
+
+def _strategy_subset(strategy, model_nums):
+    """ Shallow copy of `strategy` trading only `model_nums`, or `strategy` itself for the full grid. """
+    if list(model_nums) == list(range(len(strategy.get_models()))):
+        return strategy
+    return _strategy_with_models(strategy, [strategy.get_models(x) for x in model_nums])
+
+def _strategy_with_models(strategy, models):
+    """ Shallow copy of `strategy` trading the given model params, sharing its params_grid and indicator plan. """
+    subset = copy.copy(strategy)
+    subset.models = models
+    return subset
+
+
+class WalkForward:
+    """ Walk-forward test of notebook 05, with the day-level backtests spread across a process pool.
+
+    Every month, each model of `strategy` is backtested on the previous month's trading days, the model
+    with the highest mean/std of daily PnL is selected, and it trades the current month.
+
+    Trade decisions on a day do not depend on AUM, so the unsized trades of every model on every needed
+    day are computed once, in parallel (`DayTrade.trade_all_gross`). Each day's options chain and
+    indicator table are loaded once in the parent and handed to workers through shared memory. Sizing,
+    AUM compounding and model selection then replay serially in day order, so the results are identical
+    to the serial notebook loop whatever the number of workers.
+
+    With a `ResultCache`, the unsized trades are persisted per (day, model), and only days, models or data
+    that are not cached yet are replayed. Reruns with another AUM, commission or max_risk, or with an extra
+    month, then only size the cached trades.
+
+    With a `ParamSearch`, each month's model is picked by successive halving over a random sample of the
+    params grid rather than by backtesting the whole grid on every day.
+
+    With a `ResultsArchive`, each month's training PnL and trades are appended to it as they complete.
+    """
+
+    def __init__(self, strategy, data_module, initial_aum = 6.5 * 1e6, commission_dollars = 0.15, max_risk = 0.025, interval = 5, max_workers = None, results_dir = None, result_cache = None, search = None, archive = None):
+        self.strategy = strategy
+        self.data_module = data_module
+        self.initial_aum = initial_aum
+        self.commission_dollars = commission_dollars
+        self.max_risk = max_risk
+        self.interval = interval
+        self.max_workers = max_workers or os.cpu_count()
+        self.results_dir = results_dir
+        self.result_cache = result_cache
+        # ParamSearch picking each month's model from a sample of the grid instead of backtesting every model
+        self.search = search
+        # ResultsArchive updated with the training and trades of each month as it completes
+        self.archive = archive
+
+    @staticmethod
+    def _month_days(days, month):
+        return [x for x in days if x.year == month.year and x.month == month.month]
+
+    def gross_trades(self, trade_days, strategy = None):
+        """ Unsized trades of every model on each day, computed across the process pool.
+
+        Each day is one task, or several when there are fewer days than workers, in which case the day's
+        models are split between them. Days and models found in `result_cache` are not replayed, and what
+        is replayed is added to it.
+
+        Args:
+            strategy (Strategy): Models to backtest; defaults to `self.strategy`.
+
+        Returns:
+            dict: Maps each trade day to the output of `DayTrade.trade_all_gross`.
+        """
+        strategy = self.strategy if strategy is None else strategy
+        results = dict()
+        if self.max_workers <= 1:
+            for trade_day in trade_days:
+                df_stock, df_options = self.data_module.read_data(trade_day)
+                pending = self._load_cached(strategy, trade_day, df_stock, df_options, results)
+                if pending is None:
+                    continue
+                fingerprint, cached, model_nums = pending
+                subset = _strategy_subset(strategy, model_nums)
+                subset.compute_tech_indicators(df_stock)
+                computed = self._store_computed(strategy, trade_day, fingerprint, model_nums, DayTrade.trade_all_gross(subset, df_options, interval = self.interval))
+                results[trade_day] = self._combine([cached, computed])
+            return results
+
+        n_chunks = max(1, self.max_workers // max(1, len(trade_days)))
+        running = dict()
+        tech_indicators, strategy.tech_indicators = strategy.tech_indicators, None # keep the pickled strategy small
+        try:
+            with ProcessPoolExecutor(max_workers = self.max_workers, initializer = _init_worker, initargs = (strategy, instrumentation.enabled)) as executor:
+                for trade_day in trade_days:
+                    # Bound the number of days held in shared memory
+                    while len(running) >= 2 * self.max_workers:
+                        self._collect(strategy, running, results, wait(running, return_when = FIRST_COMPLETED).done)
+                    df_stock, df_options = self.data_module.read_data(trade_day)
+                    pending = self._load_cached(strategy, trade_day, df_stock, df_options, results)
+                    if pending is None:
+                        continue
+                    fingerprint, cached, model_nums = pending
+                    indicators = strategy.compute_tech_indicators(df_stock, ret = True)
+                    chain = OptionsChain(df_options)
+                    shared = SharedArrays(
+                        {f"chain:{key}": values for key, values in chain.to_arrays().items()}
+                        | {"indicators": indicators.to_numpy(dtype = float), "indicator_times": indicators.index.as_unit("ns").asi8}
+                    )
+                    day = {"shared": shared, "fingerprint": fingerprint, "parts": [cached], "remaining": 0}
+                    for chunk in np.array_split(np.asarray(model_nums), min(n_chunks, len(model_nums))):
+                        future = executor.submit(_trade_day_gross, shared.descriptor, chain.times.tz, list(indicators.columns), self.interval, chunk.tolist())
+                        running[future] = (trade_day, chunk.tolist(), day)
+                        day["remaining"] += 1
+                self._collect(strategy, running, results, list(running))
+        finally:
+            strategy.tech_indicators = tech_indicators
+            for _, _, day in running.values():
+                self._release(day)
+        return results
+
+    def _load_cached(self, strategy, trade_day, df_stock, df_options, results):
+        """ Fill `results[trade_day]` from the cache if every model is cached.
+
+        Returns:
+            tuple: (fingerprint, cached gross trades, model numbers to replay), or None if nothing is left to replay.
+        """
+        models = strategy.get_models()
+        if self.result_cache is None:
+            return None, None, list(range(len(models)))
+        fingerprint = self.result_cache.fingerprint(df_stock, df_options)
+        cached, missing = self.result_cache.load(trade_day, fingerprint, models, interval = self.interval, tz = df_options.loc[:, "time"].dt.tz)
+        instrumentation.count("walkforward.cached_model_days", len(models) - len(missing))
+        if len(missing) == 0:
+            results[trade_day] = cached
+            return None
+        return fingerprint, cached, missing
+
+    def _store_computed(self, strategy, trade_day, fingerprint, model_nums, gross_trades):
+        """ Cache replayed trades (indexed by position in `model_nums`) and index them by model number. """
+        if self.result_cache is not None:
+            models = strategy.get_models()
+            self.result_cache.store(trade_day, fingerprint, [models[x] for x in model_nums], gross_trades, interval = self.interval)
+        return gross_trades.assign(model_num = np.asarray(model_nums, dtype = int)[gross_trades.loc[:, "model_num"].to_numpy(dtype = int)])
+
+    @staticmethod
+    def _combine(parts):
+        """ Gross trades of a day from cached and replayed parts, ordered as `DayTrade.trade_all_gross` orders them. """
+        parts = [x for x in parts if x is not None and len(x) > 0]
+        if len(parts) == 0:
+            return pd.DataFrame(columns = DayTrade.GROSS_TRADE_COLUMNS)
+        if len(parts) == 1:
+            return parts[0]
+        return ResultCache.sort(pd.concat(parts))
+
+    def _collect(self, strategy, running, results, done):
+        for future in done:
+            trade_day, model_nums, day = running.pop(future)
+            day["remaining"] -= 1
+            try:
+                gross_trades, report = future.result()
+                if report is not None:
+                    instrumentation.merge(report)
+                day["parts"].append(self._store_computed(strategy, trade_day, day["fingerprint"], model_nums, gross_trades))
+            finally:
+                if day["remaining"] == 0:
+                    self._release(day)
+            if day["remaining"] == 0:
+                results[trade_day] = self._combine(day["parts"])
+
+    @staticmethod
+    def _release(day):
+        if day["shared"] is not None:
+            day["shared"].unlink()
+            day["shared"] = None
+
+    def _model_day_pnl(self, gross_trades, models_aum):
+        """ Sized trades of a day and the PnL of each model.
+
+        A model's PnL is the sum of its trades' PnL, skipping NaN (with `np.nansum`), which gives the same
+        value as the notebook loop's `trades["pnl"].sum()`. Models without trades get 0.
+        """
+        with instrumentation.timer("walkforward.model_day_pnl"):
+            trades = DayTrade.size_trades(gross_trades, models_aum, commission_dollars = self.commission_dollars, max_risk = self.max_risk)
+            pnl = trades.loc[:, "pnl"].to_numpy(dtype = float)
+            bounds = np.searchsorted(trades.loc[:, "model_num"].to_numpy(dtype = int), np.arange(len(models_aum) + 1))
+        return trades, [np.nansum(pnl[bounds[m]:bounds[m + 1]]) if bounds[m + 1] > bounds[m] else 0 for m in range(len(models_aum))]
+
+    @staticmethod
+    def rank_models(training):
+        """ Models ranked by mean / std of their daily PnL, best first.
+
+        Args:
+            training (pd.DataFrame): One row per (model, day) with "model_num" and "pnl" columns.
+
+        Returns:
+            pd.Series: Ratio per model number, descending, with undefined ratios (NaN) last.
+        """
+        ratio = dict()
+        for model_num in training.loc[:, "model_num"].unique():
+            df_plot = training[training.loc[:, "model_num"] == model_num]
+            ratio[model_num] = df_plot.loc[:, "pnl"].mean() / df_plot.loc[:, "pnl"].std()
+        return pd.Series(ratio).replace([np.inf, -np.inf], np.nan).sort_values(ascending = False)
+
+    def run(self, trading_months, available_days = None):
+        """ Run the walk-forward test.
+
+        Args:
+            trading_months (list): First day (datetime) of each month to trade.
+            available_days (list): Trading days to use; defaults to `data_module.available_days()`.
+
+        Returns:
+            dict: "training" (month -> per-model daily PnL of the selection month), "rankings"
+                (month -> model ranking), "trade_summary", "trades" and "aums" (AUM after each trade day,
+                starting with the initial AUM). With a `search`, training and rankings cover the models
+                it evaluated, and model numbers index the full params grid.
+        """
+        if available_days is None:
+            available_days = self.data_module.available_days()
+        if self.search is None:
+            needed = sorted({x for month in trading_months for x in self._month_days(available_days, month) + self._month_days(available_days, month - relativedelta(months = 1))})
+            with instrumentation.timer("walkforward.gross_trades"):
+                gross_by_day = self.gross_trades(needed)
+            instrumentation.count("walkforward.days", len(needed))
+
+        models = self.strategy.get_models()
+        AUM = self.initial_aum
+        AUMs = [AUM]
+        training = dict()
+        rankings = dict()
+        trade_summary = list()
+        all_actual_trades = list()
+        for trade_month in trading_months:
+            # Find best model in past month
+            past_month = trade_month - relativedelta(months = 1)
+            past_days = self._month_days(available_days, past_month)
+            if len(past_days) == 0:
+                print(f"No trading days in {past_month.strftime('%Y-%m')} to select a model for {trade_month.strftime('%Y-%m')}")
+                continue
+            if self.search is None:
+                models_AUM = [AUM] * len(models)
+                all_all_trades = list()
+                for trade_day in past_days:
+                    _, pnls = self._model_day_pnl(gross_by_day[trade_day], models_AUM)
+                    for model_num, pnl in enumerate(pnls):
+                        models_AUM[model_num] += pnl
+                    all_all_trades.append(pd.DataFrame([models[x] | {"pnl" : pnls[x], "model_num" : x} for x in range(len(models))]).assign(day = trade_day))
+                all_all_trades = pd.concat(all_all_trades)
+                model_rankings = self.rank_models(all_all_trades)
+                best_model = model_rankings.index[0]
+                best_params = models[best_model]
+            else:
+                selection = self.search.select(self, past_days, AUM)
+                all_all_trades, model_rankings = selection["training"], selection["rankings"]
+                best_model, best_params = selection["best_model"], selection["params"]
+            training[past_month] = all_all_trades
+            rankings[past_month] = model_rankings
+            if self.results_dir is not None:
+                all_all_trades.to_csv(os.path.join(self.results_dir, f"past_mth_test_{past_month.strftime('%Y-%m')}.csv"))
+                model_rankings.to_csv(os.path.join(self.results_dir, f"past_mth_test_rankings_{past_month.strftime('%Y-%m')}.csv"))
+            if self.archive is not None:
+                self.archive.append_training(past_month, all_all_trades)
+            print(f"Model selected from {past_month.strftime('%Y-%m')}: {best_model}:{round(model_rankings.iloc[0], 3)}")
+
+            # Actual trading
+            trade_days = self._month_days(available_days, trade_month)
+            if self.search is None:
+                month_gross = {x: gross_by_day[x] for x in trade_days}
+            else:
+                month_gross = self.gross_trades(trade_days, strategy = _strategy_with_models(self.strategy, [best_params]))
+                month_gross = {x: gross.assign(model_num = best_model) for x, gross in month_gross.items()}
+            for trade_day in trade_days:
+                gross_trades = month_gross[trade_day]
+                gross_trades = gross_trades[gross_trades.loc[:, "model_num"] == best_model].assign(model_num = 0)
+                trades = DayTrade.size_trades(gross_trades, [AUMs[-1]], commission_dollars = self.commission_dollars, max_risk = self.max_risk)
+                trades = trades.drop(columns = "model_num").reset_index(drop = True)
+                if len(trades) == 0:
+                    trades = pd.DataFrame(columns = DayTrade.TRADE_COLUMNS)
+                pnl = trades.loc[:, "pnl"].sum() if len(trades) > 0 else 0
+                AUM = AUMs[-1] + pnl
+                AUMs.append(AUM)
+                all_actual_trades.append(trades)
+                trade_summary.append(best_params | {"pnl" : trades.loc[:, "pnl"].sum(), "model_num" : best_model, "day" : trade_day})
+                print(f"{trade_day.strftime('%Y-%m-%d')} : AUM = {format(round(AUM), ',')}")
+            if self.archive is not None and len(trade_days) > 0:
+                self.archive.append_trades(trade_month, pd.concat(all_actual_trades[-len(trade_days):]), days = trade_days, params = best_params)
+
+        trade_summary = pd.DataFrame(trade_summary)
+        all_actual_trades = pd.concat(all_actual_trades) if len(all_actual_trades) > 0 else pd.DataFrame(columns = DayTrade.TRADE_COLUMNS)
+        if self.results_dir is not None:
+            trade_summary.to_csv(os.path.join(self.results_dir, "trade_summary.csv"))
+            all_actual_trades.to_csv(os.path.join(self.results_dir, "trading_mth_test.csv"))
+        return {"training": training, "rankings": rankings, "trade_summary": trade_summary, "trades": all_actual_trades, "aums": AUMs}